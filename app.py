@@ -1,108 +1,482 @@
+import io
+import json
 import os
-import subprocess
-import uuid
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import queue
+import threading
+from flask import Flask, Response, abort, request, jsonify, render_template, send_file
+
+import kokoro_tts
+import metrics
+from job_queue import JobQueue, QueueFull
+from sessions import SessionStore
+from tts_engine import SynthesisEngine
 
 app = Flask(__name__, static_folder='static')
 
+# Hand file transfers to a fronting nginx/Apache through X-Sendfile instead of streaming them from Python
+app.config['USE_X_SENDFILE'] = os.environ.get('KOKORO_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+
+# Cache-Control for audio of finished sessions, which never changes once written
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 # Ensure output directory exists
 os.makedirs('output', exist_ok=True)
 
+# Output formats the installed libsndfile can encode, and their file extensions
+OUTPUT_FORMATS = kokoro_tts.available_formats()
+AUDIO_EXTENSIONS = tuple(f".{kokoro_tts.OUTPUT_FORMATS[name][0]}" for name in OUTPUT_FORMATS)
+
+# Accept header MIME types mapped to the format served for them, in order of preference
+ACCEPT_FORMATS = [(mimetype, name) for mimetype, name in [
+    ('audio/wav', 'wav'),
+    ('audio/x-wav', 'wav'),
+    ('audio/ogg', 'opus'),
+    ('audio/opus', 'opus'),
+    ('audio/flac', 'flac'),
+    ('audio/mpeg', 'mp3'),
+] if name in OUTPUT_FORMATS]
+
+# Resident synthesis engine shared by all requests in this process
+engine = SynthesisEngine()
+
+# Every synthesis, synchronous or not, runs through this bounded worker pool
+jobs = JobQueue(engine)
+
+# Most voice/speed combinations one /generate/variants request may ask for
+MAX_VARIANTS = 16
+
+# Index of session output directories, cleaned up by a background janitor
+sessions = SessionStore(AUDIO_EXTENSIONS)
+
+# Set once warm-up has finished; warm_up_errors holds anything that failed to load
+warmed_up = threading.Event()
+warm_up_errors = []
+_warm_up_lock = threading.Lock()
+_warm_up_pid = None
+
+def warm_up():
+    """Load and verify the configured pipelines and voices, then report ready."""
+    try:
+        errors = engine.warm_up(verify=True)
+    except Exception as e:
+        errors = [f"{type(e).__name__}: {e}"]
+    for error in errors:
+        print(f"Warm-up error: {error}")
+    warm_up_errors[:] = errors
+    warmed_up.set()
+
+def start_warm_up():
+    """Warm up in a background thread, once per process, so /healthz answers while models load.
+    
+    Keyed on the process id so a worker forked before warm-up finished
+    starts its own instead of waiting on a thread it did not inherit.
+    """
+    global _warm_up_pid
+    with _warm_up_lock:
+        if warmed_up.is_set() or _warm_up_pid == os.getpid():
+            return
+        _warm_up_pid = os.getpid()
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+def _cache_hit_ratios():
+    ratios = {}
+    for name, cache in (('audio', engine.results), ('segment', engine.segments), ('voice', engine.voices),
+                        ('phoneme', engine.phonemes)):
+        stats = cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        ratios[name] = stats['hits'] / lookups if lookups else 0.0
+    return ratios
+
+metrics.Gauge('kokoro_queue_depth', 'Jobs waiting for a worker', jobs.queue_depth)
+metrics.Gauge('kokoro_jobs_in_flight', 'Jobs currently being synthesized', jobs.in_flight)
+metrics.Gauge('kokoro_cache_hit_ratio', 'Hits over lookups per cache', _cache_hit_ratios, labels=('cache',))
+metrics.Gauge('kokoro_sessions', 'Session directories kept on disk', lambda: sessions.stats()['sessions'])
+metrics.Gauge('kokoro_session_bytes', 'Bytes of session output kept on disk', lambda: sessions.stats()['bytes'])
+
+@app.before_request
+def start_background_threads():
+    # A worker forked from a preloading master inherits none of the threads started at import
+    jobs.start()
+    sessions.start()
+    start_warm_up()
+
+@app.after_request
+def count_request(response):
+    metrics.HTTP_REQUESTS.inc(endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/generate', methods=['POST'])
-def generate_audio():
-    data = request.form
+def parse_generate_request():
+    """Read the /generate form into synthesis parameters.
     
+    Returns (session_id, session_output_dir, params) where params is None if
+    no text was provided.
+    """
     # Generate a unique session ID for this request
-    session_id = str(uuid.uuid4())
-    session_output_dir = os.path.join('output', session_id)
-    os.makedirs(session_output_dir, exist_ok=True)
-    
-    # Build command
-    cmd = ['python3', 'kokoro_tts.py']
+    session_id, session_output_dir = sessions.create()
+    try:
+        params = read_generate_params(session_id)
+    except ValueError:
+        sessions.finish(session_id)
+        raise
+    if params is None:
+        sessions.finish(session_id)
+    return session_id, session_output_dir, params
+
+def read_generate_params(session_id):
+    data = request.form
     
     # Handle text input
+    text = None
     if data.get('inputType') == 'text' and data.get('text'):
-        cmd.extend(['--text', data.get('text')])
+        text = data.get('text')
     elif data.get('inputType') == 'file' and request.files.get('textFile'):
         # Save uploaded file
-        file_path = os.path.join('input', f"{session_id}.txt")
-        os.makedirs('input', exist_ok=True)
+        file_path = sessions.upload_path(session_id)
+        os.makedirs(sessions.input_dir, exist_ok=True)
         request.files['textFile'].save(file_path)
-        cmd.extend(['--text-file', file_path])
+        with open(file_path, 'r') as f:
+            text = f.read()
     
-    # Add other parameters
-    if data.get('langCode'):
-        cmd.extend(['--lang-code', data.get('langCode')])
+    if not text:
+        return None
     
-    if data.get('voice'):
-        cmd.extend(['--voice', data.get('voice')])
+    params = {
+        'text': text,
+        'lang_code': data.get('langCode') or 'a',
+        'voice': data.get('voice') or 'af_heart',
+        'speed': float(data.get('speed') or 1.0),
+        'output_format': negotiate_format(data)
+    }
+    if data.get('stitch'):
+        params['stitch'] = True
+        params['silence_ms'] = float(data.get('silenceMs') or kokoro_tts.STITCH_SILENCE_MS)
+        params['crossfade_ms'] = float(data.get('crossfadeMs') or kokoro_tts.STITCH_CROSSFADE_MS)
+    chunk_policy = (data.get('chunkPolicy') or kokoro_tts.DEFAULT_CHUNK_POLICY).lower()
+    if chunk_policy not in kokoro_tts.CHUNK_POLICIES:
+        raise ValueError(f"Unsupported chunk policy: {chunk_policy}; "
+                         f"choose one of {', '.join(kokoro_tts.CHUNK_POLICIES)}")
+    if chunk_policy != kokoro_tts.DEFAULT_CHUNK_POLICY:
+        params['chunk_policy'] = chunk_policy
+    print(f"Generating session {session_id}: lang_code={params['lang_code']}, "
+          f"voice={params['voice']}, speed={params['speed']}")
+    return params
+
+def negotiate_format(data):
+    """Pick the output format from the "format" field, else the Accept header."""
+    requested = (data.get('format') or '').lower()
+    if requested:
+        if requested not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported format: {requested}; choose one of {', '.join(OUTPUT_FORMATS)}")
+        return requested
+    best = request.accept_mimetypes.best_match([mimetype for mimetype, _ in ACCEPT_FORMATS])
+    return dict(ACCEPT_FORMATS).get(best, kokoro_tts.DEFAULT_FORMAT)
+
+def parse_variants(params):
+    """Read the voices and speeds fields into a list of (voice, speed) pairs.
     
-    if data.get('speed'):
-        cmd.extend(['--speed', data.get('speed')])
+    Both are comma-separated and default to the request's single voice and
+    speed; every voice is combined with every speed.
+    """
+    data = request.form
+    voices = [voice.strip() for voice in (data.get('voices') or '').split(',') if voice.strip()]
+    try:
+        speeds = [float(speed) for speed in (data.get('speeds') or '').split(',') if speed.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid speeds: {data.get('speeds')}")
+    variants = [(voice, speed) for voice in voices or [params['voice']] for speed in speeds or [params['speed']]]
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"{len(variants)} variants requested; at most {MAX_VARIANTS} are allowed")
+    return variants
+
+def submit_session_job(session_id, session_output_dir, params, on_segment=None, on_finish=None):
+    """Queue a job for a session and index the session's files once it ends.
+
+    Each file's etag is recorded as soon as the job reports it written.
+    """
+    def finished(job):
+        sessions.finish(session_id)
+        if on_finish is not None:
+            on_finish(job)
     
-    # Set output directory to the session-specific directory
-    cmd.extend(['--output-dir', session_output_dir])
+    def segment_done(index, filename):
+        sessions.written(session_id, filename)
+        if on_segment is not None:
+            on_segment(index, filename)
     
-    # Execute command
     try:
-        print(f"Executing command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        print(f"Command exit code: {result.returncode}")
-        print(f"Command stdout: {result.stdout}")
-        print(f"Command stderr: {result.stderr}")
-        
-        # Get list of generated files
-        generated_files = []
-        if os.path.exists(session_output_dir):
-            print(f"Checking output directory: {session_output_dir}")
-            for file in os.listdir(session_output_dir):
-                if file.endswith('.wav'):
-                    file_path = os.path.join(session_output_dir, file)
-                    file_size = os.path.getsize(file_path)
-                    print(f"Found WAV file: {file}, size: {file_size} bytes")
-                    generated_files.append(file)
-            
-            if not generated_files:
-                print(f"No WAV files found in {session_output_dir}")
+        return jobs.submit(session_id, session_output_dir, params, on_segment=segment_done, on_finish=finished)
+    except QueueFull:
+        sessions.finish(session_id)
+        raise
+
+def expired_response(session_id):
+    return jsonify(error_response(session_id, 'Session has expired')), 410
+
+def build_response(session_id, result):
+    return {
+        'success': bool(result['files']),
+        'error': '' if result['files'] else 'No audio files were generated',
+        'session_id': session_id,
+        'files': result['files'],
+        'using_kokoro': result['using_kokoro'],
+        'cached': result['cached'],
+        'segments_reused': result['segments_reused'],
+        'audio_seconds': result['audio_seconds'],
+        'timings': {stage: round(seconds, 4) for stage, seconds in result['timings'].items()}
+    }
+
+def error_response(session_id, error):
+    return {
+        'success': False,
+        'error': error,
+        'session_id': session_id,
+        'files': []
+    }
+
+def busy_response(session_id, error):
+    response = jsonify(error_response(session_id, f"Server is busy, try again later ({error})"))
+    response.status_code = 429
+    response.headers['Retry-After'] = '5'
+    return response
+
+def job_response(job):
+    data = job.to_dict()
+    if job.status == 'done':
+        data['result'] = build_response(job.session_id, job.result)
+    return data
+
+@app.route('/generate', methods=['POST'])
+def generate_audio():
+    try:
+        session_id, session_output_dir, params = parse_generate_request()
+    except ValueError as e:
+        return jsonify(error_response(None, str(e)))
+    if params is None:
+        return jsonify(error_response(session_id, 'No text provided'))
+    
+    try:
+        job = submit_session_job(session_id, session_output_dir, params)
+    except QueueFull as e:
+        return busy_response(session_id, str(e))
+    
+    job.wait()
+    if job.status != 'done':
+        print(f"Error generating audio: {job.error}")
+        return jsonify(error_response(session_id, job.error or f"Job {job.status}"))
+    
+    response_data = build_response(session_id, job.result)
+    print(f"Session {session_id}: {len(response_data['files'])} file(s), timings {response_data['timings']}")
+    return jsonify(response_data)
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_audio_stream():
+    """Same as /generate, but streams server-sent events as segments are written.
+    
+    Emits a "segment" event with the URL of each file as soon as it exists,
+    then a final "done" event carrying the usual /generate response, or an
+    "error" event.
+    """
+    try:
+        session_id, session_output_dir, params = parse_generate_request()
+    except ValueError as e:
+        return jsonify(error_response(None, str(e)))
+    if params is None:
+        return jsonify(error_response(session_id, 'No text provided'))
+    
+    events = queue.Queue()
+    
+    def on_segment(index, filename):
+        events.put(('segment', {
+            'index': index,
+            'file': filename,
+            'url': f'/output/{session_id}/{filename}'
+        }))
+    
+    def on_finish(job):
+        if job.status == 'done':
+            events.put(('done', build_response(session_id, job.result)))
         else:
-            print(f"Output directory does not exist: {session_output_dir}")
-        
-        response_data = {
-            'success': result.returncode == 0,
-            'output': result.stdout,
-            'error': result.stderr,
-            'session_id': session_id,
-            'files': generated_files,
-            'command': ' '.join(cmd)  # Include the command for debugging
-        }
-        
-        print(f"Sending response: {response_data}")
-        return jsonify(response_data)
-    except Exception as e:
-        print(f"Error executing command: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'command': ' '.join(cmd) if 'cmd' in locals() else 'Command not defined'
-        })
+            events.put(('error', error_response(session_id, job.error or f"Job {job.status}")))
+    
+    # The job runs on a worker thread, so a disconnecting client cannot abort it halfway
+    try:
+        submit_session_job(session_id, session_output_dir, params, on_segment=on_segment, on_finish=on_finish)
+    except QueueFull as e:
+        return busy_response(session_id, str(e))
+    
+    def stream():
+        while True:
+            event, payload = events.get()
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            if event != 'segment':
+                break
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/generate/variants', methods=['POST'])
+def generate_variants():
+    """Synthesize the same text with several voices and speeds.
+    
+    Variants run one at a time until one has actually been synthesized, so
+    that the engine's phoneme cache holds every paragraph (an audio cache hit
+    does not touch it); the rest are then queued together and synthesized
+    from the cached phonemes. Each variant gets its own session, and the response lists the
+    usual /generate result for each one in request order.
+    """
+    try:
+        session_id, session_output_dir, params = parse_generate_request()
+    except ValueError as e:
+        return jsonify(error_response(None, str(e)))
+    if params is None:
+        return jsonify(error_response(session_id, 'No text provided'))
+    try:
+        variants = parse_variants(params)
+    except ValueError as e:
+        sessions.finish(session_id)
+        return jsonify(error_response(session_id, str(e)))
+    
+    targets = [(session_id, session_output_dir)] + [sessions.create() for _ in variants[1:]]
+    queued = [None] * len(variants)
+    phonemized = False
+    for i, ((voice, speed), (variant_session, variant_dir)) in enumerate(zip(variants, targets)):
+        try:
+            queued[i] = submit_session_job(variant_session, variant_dir, dict(params, voice=voice, speed=speed))
+        except QueueFull as e:
+            queued[i] = e
+            continue
+        if not phonemized:
+            job = queued[i]
+            job.wait()
+            # A failed variant will not fill the cache either, so stop waiting on them
+            phonemized = job.status != 'done' or not job.result['cached']
+    
+    results = []
+    for (voice, speed), (variant_session, _), job in zip(variants, targets, queued):
+        if isinstance(job, QueueFull):
+            result = error_response(variant_session, f"Server is busy, try again later ({job})")
+        else:
+            job.wait()
+            if job.status == 'done':
+                result = build_response(variant_session, job.result)
+            else:
+                result = error_response(variant_session, job.error or f"Job {job.status}")
+        results.append(dict(result, voice=voice, speed=speed))
+    
+    failed = [r for r in results if not r['success']]
+    return jsonify({
+        'success': not failed,
+        'error': f"{len(failed)} of {len(results)} variants failed" if failed else '',
+        'variants': results
+    })
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a synthesis job with the same form as /generate and return at once."""
+    try:
+        session_id, session_output_dir, params = parse_generate_request()
+    except ValueError as e:
+        return jsonify(error_response(None, str(e))), 400
+    if params is None:
+        return jsonify(error_response(session_id, 'No text provided')), 400
+    
+    try:
+        job = submit_session_job(session_id, session_output_dir, params)
+    except QueueFull as e:
+        return busy_response(session_id, str(e))
+    return jsonify(job_response(job)), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_response(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not job.finished:
+        return jsonify(job_response(job)), 202
+    if job.status != 'done':
+        return jsonify(error_response(job.session_id, job.error or f"Job {job.status}")), 409
+    return jsonify(build_response(job.session_id, job.result))
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_response(job))
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Report ready once the preloaded models and voices are verified and the synthesis workers are running."""
+    if not warmed_up.is_set():
+        return jsonify({'status': 'warming_up'}), 503
+    if warm_up_errors:
+        return jsonify({'status': 'failed', 'errors': warm_up_errors}), 503
+    if not jobs.alive():
+        return jsonify({'status': 'failed', 'errors': ['Synthesis workers are not running']}), 503
+    return jsonify({'status': 'ready', 'pipelines': engine.pipelines.loaded(),
+                    'queue_depth': jobs.queue_depth()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/output/<session_id>/<filename>')
 def serve_audio(session_id, filename):
-    return send_from_directory(os.path.join('output', session_id), filename)
+    """Serve a session file with byte ranges, a content-hash ETag and caching headers.
+    
+    Files held in the audio cache's hot tier are served from memory; others
+    go through send_file, which uses the server's sendfile support when it
+    has one.
+    """
+    if sessions.is_expired(session_id):
+        return expired_response(session_id)
+    data = engine.results.read_hot(session_id, filename)
+    info = sessions.file_info(session_id, filename, data)
+    if info is None:
+        abort(404)
+    etag, immutable = info
+    
+    if data is not None:
+        source = io.BytesIO(data)
+    else:
+        path = sessions.file_path(session_id, filename)
+        if path is None:
+            abort(404)
+        source = os.path.abspath(path)
+    response = send_file(source, mimetype=kokoro_tts.mimetype_for(filename), etag=etag, conditional=True)
+    # Segments of a running session are final once announced, but an unannounced stitched file is still growing
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+    return response
 
 @app.route('/output/<session_id>')
 def list_session_files(session_id):
-    session_dir = os.path.join('output', session_id)
-    if not os.path.exists(session_dir):
+    files = sessions.files(session_id)
+    if files is None:
+        if sessions.is_expired(session_id):
+            return expired_response(session_id)
         return jsonify({'files': []})
-    
-    files = [f for f in os.listdir(session_dir) if f.endswith('.wav')]
     return jsonify({'files': files})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # The debug reloader's parent process only watches files, so skip warm-up there
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up()
+    app.run(host='0.0.0.0', port=5001, debug=True)
+else:
+    # Imported by a WSGI server, flask run or a test client, so this process serves requests
+    start_warm_up()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from kokoro_tts import segment_sort_key
+
+# Directory holding cached results; kept on the output volume so hits can be hard-linked
+CACHE_DIR = os.environ.get('KOKORO_AUDIO_CACHE_DIR', os.path.join('output', '.cache'))
+
+# Disk budget for cached audio in megabytes (0 disables the cache)
+CACHE_MAX_MB = float(os.environ.get('KOKORO_AUDIO_CACHE_MB', '1024'))
+
+# Memory budget for the hot tier in megabytes (0 disables it)
+CACHE_MEMORY_MB = float(os.environ.get('KOKORO_AUDIO_CACHE_MEMORY_MB', '64'))
+
+# Memory budget for the per-paragraph segment cache in megabytes (0 disables it)
+SEGMENT_CACHE_MB = float(os.environ.get('KOKORO_SEGMENT_CACHE_MB', '256'))
+
+# Number of paragraphs whose phonemes are kept for reuse with other voices and speeds (0 disables it)
+PHONEME_CACHE_SIZE = int(os.environ.get('KOKORO_PHONEME_CACHE_SIZE', '4096'))
+
+def make_key(text, lang_code, voice, speed, options=None):
+    """Return the content address for a synthesis request.
+
+    Line endings and trailing whitespace are normalized because they do not
+    change the audio; blank lines are kept since they decide segmentation.
+    options holds any output settings that change the files produced.
+    """
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').strip().split('\n')]
+    params = {
+        'text': '\n'.join(lines),
+        'lang_code': lang_code.lower(),
+        'voice': voice,
+        'speed': f"{float(speed):.3f}",
+    }
+    if options:
+        params['options'] = options
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+class AudioCache:
+    """Content-addressed cache of finished audio files.
+
+    Each entry is a directory named after make_key() holding the segment
+    files of one request. Entries are hard-linked into session directories,
+    so a hit costs no model call and no extra disk space. The least recently
+    used entries are removed once the disk budget is exceeded, and the most
+    recent ones are optionally also kept in memory for serving.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB, memory_mb=CACHE_MEMORY_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.memory_bytes = int(memory_mb * 1024 * 1024)
+        self.enabled = self.max_bytes > 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (files, total bytes), least recently used first
+        self._disk_bytes = 0
+        self._hot = OrderedDict()  # key -> {filename: bytes}
+        self._hot_bytes = 0
+        self._sessions = OrderedDict()  # session_id -> key, for serving from the hot tier
+        self._lock = threading.Lock()
+        if self.enabled:
+            self._load_index()
+
+    def _load_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if key.startswith('.tmp-'):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            if not os.path.isdir(entry_dir):
+                continue
+            files = sorted(os.listdir(entry_dir), key=segment_sort_key)
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in files)
+            entries.append((os.path.getmtime(entry_dir), key, files, size))
+        for _, key, files, size in sorted(entries):
+            self._entries[key] = (files, size)
+            self._disk_bytes += size
+
+    def fetch(self, key, output_dir):
+        """Link the cached files for key into output_dir and return their names.
+
+        Returns None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            files, size = list(entry[0]), entry[1]
+            promote = 0 < size <= self.memory_bytes and key not in self._hot
+            self._remember_session(output_dir, key)
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            for filename in files:
+                _link_or_copy(os.path.join(entry_dir, filename), os.path.join(output_dir, filename))
+            # Persist recency so the LRU order survives restarts
+            os.utime(entry_dir)
+        except OSError as e:
+            print(f"Error reading cached audio {key}: {type(e).__name__}: {e}")
+            self._drop(key)
+            return None
+        if promote:
+            self._add_hot(key, entry_dir, files)
+        return files
+
+    def store(self, key, output_dir, files):
+        """Add the files generated in output_dir to the cache under key."""
+        if not self.enabled or not files:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+
+        tmp_dir = os.path.join(self.cache_dir, f'.tmp-{key}-{uuid.uuid4().hex}')
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            os.makedirs(tmp_dir)
+            size = 0
+            for filename in files:
+                dst = os.path.join(tmp_dir, filename)
+                _link_or_copy(os.path.join(output_dir, filename), dst)
+                size += os.path.getsize(dst)
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # Most likely a concurrent identical request stored the entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                print(f"Error caching audio {key}: {type(e).__name__}: {e}")
+                return
+            with self._lock:
+                if key in self._entries:
+                    return
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in files)
+
+        with self._lock:
+            self._entries[key] = (list(files), size)
+            self._disk_bytes += size
+            self._remember_session(output_dir, key)
+            evicted = []
+            while self._disk_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, (_, old_size) = self._entries.popitem(last=False)
+                self._disk_bytes -= old_size
+                self._discard_hot(old_key)
+                evicted.append(old_key)
+        for old_key in evicted:
+            shutil.rmtree(os.path.join(self.cache_dir, old_key), ignore_errors=True)
+
+        if 0 < size <= self.memory_bytes:
+            self._add_hot(key, entry_dir, files)
+
+    def _drop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._disk_bytes -= entry[1]
+            self._discard_hot(key)
+        shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def _remember_session(self, output_dir, key):
+        if self.memory_bytes <= 0:
+            return
+        session_id = os.path.basename(os.path.normpath(output_dir))
+        self._sessions[session_id] = key
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > 10000:
+            self._sessions.popitem(last=False)
+
+    def _add_hot(self, key, entry_dir, files):
+        blobs = {}
+        try:
+            for filename in files:
+                with open(os.path.join(entry_dir, filename), 'rb') as f:
+                    blobs[filename] = f.read()
+        except OSError:
+            # Evicted from disk while we were reading it
+            return
+        size = sum(len(b) for b in blobs.values())
+        with self._lock:
+            if key in self._hot:
+                return
+            self._hot[key] = blobs
+            self._hot_bytes += size
+            while self._hot_bytes > self.memory_bytes:
+                old_key, old_blobs = self._hot.popitem(last=False)
+                self._hot_bytes -= sum(len(b) for b in old_blobs.values())
+
+    def _discard_hot(self, key):
+        blobs = self._hot.pop(key, None)
+        if blobs is not None:
+            self._hot_bytes -= sum(len(b) for b in blobs.values())
+
+    def read_hot(self, session_id, filename):
+        """Return the in-memory bytes of a session file, or None if not hot."""
+        with self._lock:
+            key = self._sessions.get(session_id)
+            blobs = self._hot.get(key) if key is not None else None
+            if blobs is None:
+                return None
+            self._hot.move_to_end(key)
+            return blobs.get(filename)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'disk_bytes': self._disk_bytes,
+                'memory_bytes': self._hot_bytes,
+            }
+
+class SegmentCache:
+    """In-memory LRU cache of synthesized audio per paragraph.
+
+    Keyed by (paragraph text, voice, speed, lang_code) so that a resubmitted
+    document with one paragraph edited only sends that paragraph to the model.
+    Values are lists of (graphemes, phonemes, audio) as produced by the
+    pipeline for that paragraph.
+    """
+
+    def __init__(self, max_mb=SEGMENT_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._segments = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, voice, speed, lang_code):
+        return make_key(text, lang_code, voice, speed)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._segments.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._segments.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, segments):
+        size = sum(audio.nbytes for _, _, audio in segments)
+        if not segments or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._segments:
+                return
+            self._segments[key] = (segments, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, old_size) = self._segments.popitem(last=False)
+                self._bytes -= old_size
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._segments),
+                    'memory_bytes': self._bytes}
+
+class PhonemeCache:
+    """In-memory LRU cache of G2P output per paragraph.
+
+    Keyed by (paragraph text, lang_code) only: phonemes do not depend on the
+    voice or speed, so any voice or speed can be synthesized from a cached
+    entry without running G2P again. Values are lists of (graphemes,
+    phonemes), one per chunk the pipeline produced for the paragraph.
+    """
+
+    def __init__(self, max_entries=PHONEME_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._phonemes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, lang_code):
+        key = (text, lang_code.lower())
+        with self._lock:
+            chunks = self._phonemes.get(key)
+            if chunks is None:
+                self.misses += 1
+                return None
+            self._phonemes.move_to_end(key)
+            self.hits += 1
+            return chunks
+
+    def put(self, text, lang_code, chunks):
+        # A chunk without phonemes cannot be replayed through generate_from_tokens
+        if self.max_entries <= 0 or not chunks or not all(ps for _, ps in chunks):
+            return
+        with self._lock:
+            self._phonemes[(text, lang_code.lower())] = list(chunks)
+            while len(self._phonemes) > self.max_entries:
+                self._phonemes.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._phonemes)}
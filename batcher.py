@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+from collections import deque
+
+# Maximum number of paragraphs dispatched together
+MAX_BATCH = int(os.environ.get('KOKORO_BATCH_SIZE', '8'))
+
+# How long the first paragraph of a batch waits for compatible ones, in milliseconds.
+# Off by default: Kokoro's model runs one sequence at a time, so waiting only adds latency
+MAX_WAIT_MS = float(os.environ.get('KOKORO_BATCH_WAIT_MS', '0'))
+
+class _Pending:
+    def __init__(self, key, payload):
+        self.key = key
+        self.payload = payload
+        self.arrived = time.monotonic()
+        self.result = None
+        self.error = None
+        self.done = False
+
+class SegmentBatcher:
+    """Groups paragraphs from concurrent requests into batches.
+
+    Paragraphs are grouped by key (lang_code, voice, speed). There is no
+    dispatcher thread: a caller of run() whose key has no batch in progress
+    becomes the leader for that key, collects up to max_batch pending
+    paragraphs, optionally waiting up to max_wait_ms for more, and calls
+    run_batch(key, payloads) on its own thread. run_batch returns one result
+    per payload, or an Exception instance for payloads that failed, and each
+    result is routed back to the request that submitted it. Batches for
+    different keys run concurrently, so languages with separate pipelines
+    stay parallel.
+
+    The wait is skipped once every active session for the key is already
+    represented in the group, so a lone request is never delayed.
+    """
+
+    def __init__(self, run_batch, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.batches = 0
+        self.batched_items = 0
+        self._pending = deque()
+        self._sessions = {}  # key -> active sessions that may submit with it
+        self._leaders = set()  # keys with a batch being collected or run
+        self._cond = threading.Condition()
+
+    def session(self, key):
+        """Context manager marking a request that may submit paragraphs with key."""
+        return _Session(self, key)
+
+    def run(self, key, payload):
+        """Submit one payload and block until its batch has been run."""
+        item = _Pending(key, payload)
+        with self._cond:
+            self._pending.append(item)
+            self._cond.notify_all()
+        while True:
+            with self._cond:
+                while not item.done and key in self._leaders:
+                    self._cond.wait()
+                if item.done:
+                    break
+                self._leaders.add(key)
+                group = self._take_batch(key)
+            try:
+                self._run_group(key, group)
+            finally:
+                with self._cond:
+                    self._leaders.discard(key)
+                    self._cond.notify_all()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def stats(self):
+        with self._cond:
+            return {
+                'batches': self.batches,
+                'items': self.batched_items,
+                'pending': len(self._pending),
+            }
+
+    def _group(self, key):
+        return [item for item in self._pending if item.key == key][:self.max_batch]
+
+    def _take_batch(self, key):
+        """Remove the next batch for key; called with the condition held."""
+        group = self._group(key)
+        deadline = group[0].arrived + self.max_wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if len(group) >= self.max_batch or len(group) >= self._sessions.get(key, 0) or remaining <= 0:
+                break
+            self._cond.wait(remaining)
+            group = self._group(key)
+        for item in group:
+            self._pending.remove(item)
+        self.batches += 1
+        self.batched_items += len(group)
+        return group
+
+    def _run_group(self, key, group):
+        try:
+            results = self.run_batch(key, [item.payload for item in group])
+        except Exception as e:
+            results = [e] * len(group)
+        with self._cond:
+            for item, result in zip(group, results):
+                if isinstance(result, Exception):
+                    item.error = result
+                else:
+                    item.result = result
+                item.done = True
+
+class _Session:
+    def __init__(self, batcher, key):
+        self.batcher = batcher
+        self.key = key
+
+    def __enter__(self):
+        with self.batcher._cond:
+            sessions = self.batcher._sessions
+            sessions[self.key] = sessions.get(self.key, 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.batcher._cond:
+            sessions = self.batcher._sessions
+            sessions[self.key] -= 1
+            if not sessions[self.key]:
+                del sessions[self.key]
+            self.batcher._cond.notify_all()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Compare the vectorized fallback synthesizer with the original loop.
+
+Run from the repository root:
+
+    python benchmarks/fallback_audio.py --repeat 20
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kokoro_tts
+
+TEXTS = {
+    'short': "Hello, this is a test of the Kokoro text-to-speech system.",
+    'paragraph': ("The quick brown fox jumps over the lazy dog. " * 6).strip(),
+    'document': ("Kokoro is an open-weight TTS model with 82 million parameters. " * 12).strip(),
+}
+
+def legacy_text_based_audio(text, duration=None):
+    """Original per-character loop implementation, kept as the baseline."""
+    sample_rate = 24000
+    
+    # Use text to determine audio characteristics
+    # Hash the text to get consistent results for the same text
+    text_hash = int(hashlib.md5(text.encode()).hexdigest(), 16)
+    
+    # Use the hash to seed the random number generator for consistent results
+    np.random.seed(text_hash % 2**32)
+    
+    # Determine duration based on text length (minimum 2 seconds, maximum 10 seconds)
+    if duration is None:
+        text_length = len(text)
+        duration = min(max(2.0, text_length / 50), 10.0)
+    
+    num_samples = int(duration * sample_rate)
+    
+    # Create time array
+    t = np.linspace(0, duration, num_samples, endpoint=False)
+    
+    # Generate audio based on text characteristics
+    audio = np.zeros(num_samples, dtype=np.float32)
+    
+    # Extract some features from the text
+    word_count = len(text.split())
+    
+    # Use text features to determine base frequency (between 220Hz and 880Hz)
+    base_freq = 220 + (text_hash % 660)
+    
+    # Create a chord based on the text
+    # More words = more complex chord
+    chord_complexity = min(5, max(2, word_count // 10 + 2))
+    
+    # Generate frequencies for the chord
+    frequencies = []
+    for i in range(chord_complexity):
+        # Use different parts of the hash for different frequencies
+        freq_factor = 1.0 + (0.2 * ((text_hash >> (i * 8)) % 256) / 256)
+        frequencies.append(base_freq * freq_factor)
+    
+    # Add the frequencies to the audio
+    for i, freq in enumerate(frequencies):
+        # Vary amplitude based on position in the chord
+        amplitude = 0.3 / (i + 1)
+        audio += amplitude * np.sin(2 * np.pi * freq * t)
+    
+    # Add some variation based on the text content
+    for i, char in enumerate(text[:min(len(text), 100)]):  # Limit to first 100 chars
+        if i >= len(t):
+            break
+            
+        # Use character ASCII value to create small variations
+        char_val = ord(char)
+        if char_val > 64 and char_val < 128:  # Only for standard ASCII
+            # Add a small blip at positions corresponding to characters
+            pos = int((i / min(len(text), 100)) * num_samples)
+            width = sample_rate // 50  # 20ms blip
+            if pos + width < num_samples:
+                # Create a small envelope
+                envelope = np.sin(np.pi * np.linspace(0, 1, width))
+                # Frequency based on character value
+                freq = 440 + (char_val - 65) * 20  # Map A-Z to different frequencies
+                blip = 0.1 * envelope * np.sin(2 * np.pi * freq * t[pos:pos+width])
+                audio[pos:pos+width] += blip
+    
+    # Apply fade in and fade out
+    fade_samples = int(0.1 * sample_rate)  # 100ms fade
+    fade_in = np.linspace(0, 1, fade_samples)
+    fade_out = np.linspace(1, 0, fade_samples)
+    
+    audio[:fade_samples] *= fade_in
+    audio[-fade_samples:] *= fade_out
+    
+    # Normalize
+    if np.max(np.abs(audio)) > 0:
+        audio = audio / np.max(np.abs(audio)) * 0.9
+    
+    # Convert to float32 for soundfile
+    audio = audio.astype(np.float32)
+    
+    return audio
+
+def best_time(func, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the text-based fallback synthesizer')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per text; the fastest is reported')
+    args = parser.parse_args()
+
+    print(f"{'text':<10} {'seconds':>8} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8} {'max diff':>9}")
+    for name, text in TEXTS.items():
+        # The new implementation logs its duration; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = best_time(legacy_text_based_audio, text, args.repeat)
+            vector = best_time(kokoro_tts.text_based_audio, text, args.repeat)
+            first = kokoro_tts.text_based_audio(text)
+            second = kokoro_tts.text_based_audio(text)
+        assert np.array_equal(first, second), f"{name}: output is not deterministic"
+        diff = np.abs(first - legacy_text_based_audio(text)).max()
+        print(f"{name:<10} {len(first) / kokoro_tts.SAMPLE_RATE:>8.2f} {legacy * 1000:>10.2f} "
+              f"{vector * 1000:>10.2f} {legacy / vector:>7.1f}x {diff:>9.5f}")
+
+if __name__ == '__main__':
+    main()
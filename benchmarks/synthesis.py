@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""End-to-end and per-stage synthesis latency benchmark.
+
+Runs on CPU without Kokoro by default: a stand-in pipeline built on
+kokoro_tts.text_based_audio takes the model's place, so the numbers track
+everything around the model (segmentation, normalization, encoding, the
+engine and Flask). Pass --kokoro to time the real pipeline when it is
+installed. Results are written as JSON so runs can be compared between
+commits:
+
+    python benchmarks/synthesis.py --repeat 20 --output bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import kokoro_tts
+
+TEXTS = {
+    'short': "Hello, this is a test of the Kokoro text-to-speech system.",
+    'paragraphs': "\n".join(
+        f"Paragraph {i} of the benchmark document, long enough to carry a full sentence of speech."
+        for i in range(8)
+    ),
+}
+
+class StandInPipeline:
+    """Mimics KPipeline's call interface using the text-based fallback audio."""
+
+    def __init__(self, lang_code='a'):
+        self.lang_code = lang_code
+        self.model = None
+        self.voices = {}
+
+    def load_voice(self, voice):
+        return voice
+
+    def __call__(self, text, voice=None, speed=1.0, split_pattern=kokoro_tts.SPLIT_PATTERN):
+        chunks = re.split(split_pattern, text.strip()) if split_pattern else [text]
+        for chunk in chunks:
+            if chunk.strip():
+                yield chunk, '', kokoro_tts.text_based_audio(chunk)
+
+class TimedPipeline:
+    """Wraps a pipeline and records the time and audio length of every segment."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.segment_seconds = []
+        self.audio_seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.pipeline, name)
+
+    def __call__(self, *args, **kwargs):
+        generator = iter(self.pipeline(*args, **kwargs))
+        while True:
+            start = time.perf_counter()
+            try:
+                gs, ps, audio = next(generator)
+            except StopIteration:
+                return
+            self.segment_seconds.append(time.perf_counter() - start)
+            self.audio_seconds += len(audio) / kokoro_tts.SAMPLE_RATE
+            yield gs, ps, audio
+
+def summarize(samples):
+    """Latency statistics in milliseconds."""
+    if not samples:
+        return {'n': 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        'n': len(samples),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+def max_rss_mb(rss=None):
+    """High-water mark of this process so far, or of a ru_maxrss value read elsewhere."""
+    if rss is None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the per-segment logging so it does not dominate the timings."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def bench_import(repeat):
+    """Time a fresh interpreter importing kokoro_tts; also returns that process's peak RSS in MB."""
+    samples, peaks = [], []
+    code = 'import resource, kokoro_tts; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, check=True,
+                                capture_output=True, text=True)
+        samples.append(time.perf_counter() - start)
+        peaks.append(int(result.stdout.split()[-1]))
+    return summarize(samples), max_rss_mb(max(peaks))
+
+def make_pipeline_factory(use_kokoro):
+    if not use_kokoro:
+        return StandInPipeline
+    if kokoro_tts.load_kpipeline_class() is None:
+        sys.exit("--kokoro was given but Kokoro could not be imported")
+    return kokoro_tts.create_pipeline
+
+def bench_pipeline_init(factory, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        factory('a')
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_synthesis(pipeline, repeat, work_dir):
+    results = {}
+    for name, text in TEXTS.items():
+        totals, first_segment, segments = [], [], []
+        audio_seconds = 0.0
+        for run in range(repeat):
+            timed = TimedPipeline(pipeline)
+            output_dir = os.path.join(work_dir, f'synth-{name}-{run}')
+            first = []
+            start = time.perf_counter()
+            with quiet():
+                kokoro_tts.synthesize(text, output_dir, pipeline=timed,
+                                      on_segment=lambda i, f: first or first.append(time.perf_counter()))
+            totals.append(time.perf_counter() - start)
+            first_segment.append(first[0] - start)
+            segments.extend(timed.segment_seconds)
+            audio_seconds += timed.audio_seconds
+        results[name] = {
+            'end_to_end': summarize(totals),
+            'time_to_first_segment': summarize(first_segment),
+            'per_segment_synthesis': summarize(segments),
+            'audio_seconds': round(audio_seconds / repeat, 3),
+            'realtime_factor': round(audio_seconds / sum(totals), 2),
+        }
+    return results
+
+def bench_normalize(repeat):
+    # Quiet enough to take the rescaling path
+    with quiet():
+        audio = kokoro_tts.text_based_audio(TEXTS['short'], duration=10.0) * np.float32(0.05)
+    samples = []
+    with quiet():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            kokoro_tts.normalize_audio(audio)
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_encode(repeat, work_dir):
+    with quiet():
+        audio = kokoro_tts.text_based_audio(TEXTS['short'], duration=10.0)
+    results = {}
+    for output_format in kokoro_tts.available_formats():
+        path = os.path.join(work_dir, kokoro_tts.output_filename('encode', output_format))
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            kokoro_tts.write_audio(path, audio, output_format)
+            samples.append(time.perf_counter() - start)
+        results[output_format] = dict(summarize(samples), bytes_per_second=round(os.path.getsize(path) / 10.0))
+    return results
+
+def bench_http(pipeline, repeat, work_dir):
+    """Compare POST /generate with calling the engine directly."""
+    # Disable result caching so every request really synthesizes
+    os.environ['KOKORO_AUDIO_CACHE_MB'] = '0'
+    os.environ['KOKORO_SEGMENT_CACHE_MB'] = '0'
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        kokoro_tts.create_pipeline = lambda lang_code, model=None: pipeline
+        with quiet():
+            import app
+        client = app.app.test_client()
+        text = TEXTS['short']
+        direct, http = [], []
+        for run in range(repeat):
+            start = time.perf_counter()
+            with quiet():
+                app.engine.synthesize(text, os.path.join('output', f'direct-{run}'))
+            direct.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with quiet():
+                response = client.post('/generate', data={'inputType': 'text', 'text': text})
+            http.append(time.perf_counter() - start)
+            assert response.get_json()['success'], response.get_json()
+    finally:
+        os.chdir(cwd)
+    overhead = [h - d for h, d in zip(http, direct)]
+    return {'engine': summarize(direct), 'http': summarize(http), 'overhead': summarize(overhead)}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark synthesis latency per stage')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per measurement')
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this path')
+    parser.add_argument('--kokoro', action='store_true', help='Use the real Kokoro pipeline instead of the stand-in')
+    parser.add_argument('--skip-http', action='store_true', help='Skip the Flask measurements')
+    args = parser.parse_args()
+
+    factory = make_pipeline_factory(args.kokoro)
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'model': 'kokoro' if args.kokoro else 'stand-in',
+        'repeat': args.repeat,
+        'stages': {},
+        # Peak RSS of the subprocess that only imports kokoro_tts
+        'import_max_rss_mb': None,
+        # This process's high-water mark after each stage, so each includes every earlier stage
+        'cumulative_max_rss_mb': {},
+    }
+    stages = report['stages']
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        stages['import'], report['import_max_rss_mb'] = bench_import(args.repeat)
+        with quiet():
+            stages['pipeline_init'] = bench_pipeline_init(factory, args.repeat)
+            pipeline = factory('a')
+        report['cumulative_max_rss_mb']['pipeline_init'] = max_rss_mb()
+        stages['synthesis'] = bench_synthesis(pipeline, args.repeat, work_dir)
+        report['cumulative_max_rss_mb']['synthesis'] = max_rss_mb()
+        stages['normalize'] = bench_normalize(args.repeat)
+        stages['encode'] = bench_encode(args.repeat, work_dir)
+        report['cumulative_max_rss_mb']['encode'] = max_rss_mb()
+        if not args.skip_http:
+            stages['http'] = bench_http(pipeline, args.repeat, work_dir)
+            report['cumulative_max_rss_mb']['http'] = max_rss_mb()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
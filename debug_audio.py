@@ -2,10 +2,33 @@
 
 import os
 import sys
+import csv
+import json
 import numpy as np
 import soundfile as sf
 import argparse
 import wave
+import concurrent.futures
+
+# Extensions picked up by --dir; these are the formats kokoro_tts.py writes
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.opus', '.mp3')
+
+# Frames of this many milliseconds whose RMS is below SILENCE_RMS count as silence
+SILENCE_FRAME_MS = 10
+SILENCE_RMS = 0.01  # -40 dBFS
+
+# Samples at or above this magnitude count as clipped
+CLIP_LEVEL = 0.999
+
+# Silence frames read per block by summarize_audio_file()
+FRAMES_PER_BLOCK = 256
+
+# Modified z-score above which a file is reported as an outlier
+OUTLIER_Z = 3.5
+
+# Per-file fields written to CSV reports, in order
+SUMMARY_FIELDS = ['path', 'error', 'samplerate', 'channels', 'frames', 'duration', 'peak', 'rms',
+                  'silence_ratio', 'clipped_samples', 'outlier']
 
 def analyze_audio_file(file_path):
     """Analyze an audio file and print detailed information about it."""
@@ -86,12 +109,176 @@ def analyze_audio_file(file_path):
         print(f"Error analyzing file: {type(e).__name__}: {e}")
         return False
 
+def summarize_audio_file(file_path):
+    """Return one-line statistics for an audio file, read block by block.
+    
+    Each block is read once as float32 and used for peak, RMS, clipping and
+    silence, so memory stays flat no matter how long the file is. Blocks are
+    a whole number of silence frames long, so frames never straddle blocks.
+    """
+    summary = {'path': file_path, 'error': ''}
+    try:
+        info = sf.info(file_path)
+        frame = max(1, info.samplerate * SILENCE_FRAME_MS // 1000)
+        peak = 0.0
+        sum_squares = 0.0
+        samples = 0
+        clipped = 0
+        silent_frames = 0
+        total_frames = 0
+        for block in sf.blocks(file_path, blocksize=frame * FRAMES_PER_BLOCK, dtype='float32'):
+            if block.ndim > 1:
+                flat = block.ravel()
+                mono = block.mean(axis=1)
+            else:
+                flat = mono = block
+            if not len(flat):
+                continue
+            magnitude = np.abs(flat)
+            peak = max(peak, float(magnitude.max()))
+            clipped += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+            sum_squares += float(np.dot(flat, flat))
+            samples += len(flat)
+            
+            # Mean square per silence frame; only the last block can end in a partial frame
+            whole = len(mono) // frame * frame
+            energy = np.einsum('ij,ij->i', mono[:whole].reshape(-1, frame), mono[:whole].reshape(-1, frame)) / frame
+            silent_frames += int(np.count_nonzero(energy < SILENCE_RMS ** 2))
+            total_frames += len(energy)
+            if whole < len(mono):
+                rest = mono[whole:]
+                silent_frames += int(float(np.dot(rest, rest)) / len(rest) < SILENCE_RMS ** 2)
+                total_frames += 1
+        
+        frames = samples // max(1, info.channels)
+        summary.update({
+            'samplerate': info.samplerate,
+            'channels': info.channels,
+            'frames': frames,
+            'duration': round(frames / info.samplerate, 3),
+            'peak': round(peak, 5),
+            'rms': round((sum_squares / samples) ** 0.5, 5) if samples else 0.0,
+            'silence_ratio': round(silent_frames / total_frames, 4) if total_frames else 1.0,
+            'clipped_samples': clipped,
+        })
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+    return summary
+
+def find_outliers(summaries):
+    """Flag files that failed, are silent or clipped, or sit far from the rest.
+    
+    Duration, RMS, peak and silence ratio are compared with the median using
+    the modified z-score (median absolute deviation, or the mean absolute
+    deviation when most files are identical), which a handful of broken
+    files cannot skew the way they would skew a mean. Sets each
+    summary's 'outlier' field to a semicolon-separated list of reasons and
+    returns the flagged summaries.
+    """
+    ok = [s for s in summaries if not s['error']]
+    limits = {}
+    for field in ('duration', 'rms', 'peak', 'silence_ratio'):
+        values = np.array([s[field] for s in ok], dtype=np.float64)
+        if len(values) < 3:
+            continue
+        median = float(np.median(values))
+        deviations = np.abs(values - median)
+        mad = float(np.median(deviations))
+        scale = mad / 0.6745 if mad > 0 else 1.253314 * float(deviations.mean())
+        if scale > 0:
+            limits[field] = (median, scale)
+    
+    flagged = []
+    for summary in summaries:
+        reasons = []
+        if summary['error']:
+            reasons.append('unreadable')
+        else:
+            if summary['peak'] < SILENCE_RMS:
+                reasons.append('silent')
+            if summary['clipped_samples']:
+                reasons.append('clipped')
+            for field, (median, scale) in limits.items():
+                z = (summary[field] - median) / scale
+                if abs(z) > OUTLIER_Z:
+                    reasons.append(f"{field} {'high' if z > 0 else 'low'}")
+        summary['outlier'] = ';'.join(reasons)
+        if reasons:
+            flagged.append(summary)
+    return flagged
+
+def aggregate(summaries):
+    ok = [s for s in summaries if not s['error']]
+    result = {'files': len(summaries), 'unreadable': len(summaries) - len(ok)}
+    if ok:
+        durations = [s['duration'] for s in ok]
+        result.update({
+            'total_duration': round(sum(durations), 3),
+            'min_duration': min(durations),
+            'median_duration': float(np.median(durations)),
+            'max_duration': max(durations),
+            'median_rms': float(np.median([s['rms'] for s in ok])),
+            'median_silence_ratio': float(np.median([s['silence_ratio'] for s in ok])),
+            'files_with_clipping': sum(1 for s in ok if s['clipped_samples']),
+        })
+    return result
+
+def analyze_directory(directory, workers=None, report=None):
+    """Summarize every audio file below directory with a process pool.
+    
+    Hidden directories, such as the web UI's audio cache, are skipped. A
+    short aggregate is printed; report, if given, receives the per-file
+    results as CSV or, for a .json path, the aggregate, outliers and files.
+    Returns the number of outliers.
+    """
+    audio_files = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        audio_files.extend(os.path.join(root, file) for file in sorted(files) if file.endswith(AUDIO_EXTENSIONS))
+    if not audio_files:
+        print(f"No audio files found in {directory}")
+        return 0
+    
+    workers = max(1, workers or os.cpu_count() or 1)
+    print(f"Analyzing {len(audio_files)} audio files with {workers} workers")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, min(64, len(audio_files) // (workers * 4)))
+        summaries = list(executor.map(summarize_audio_file, audio_files, chunksize=chunksize))
+    
+    outliers = find_outliers(summaries)
+    totals = aggregate(summaries)
+    for key, value in totals.items():
+        print(f"{key}: {value}")
+    print(f"outliers: {len(outliers)}")
+    for summary in outliers[:20]:
+        print(f"  {summary['path']}: {summary['outlier']}")
+    if len(outliers) > 20:
+        print(f"  ... and {len(outliers) - 20} more")
+    
+    if report:
+        if report.endswith('.json'):
+            with open(report, 'w') as f:
+                json.dump({'aggregate': totals, 'outliers': outliers, 'files': summaries}, f, indent=2)
+        else:
+            with open(report, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, restval='')
+                writer.writeheader()
+                writer.writerows(summaries)
+        print(f"Report written to {report}")
+    return len(outliers)
+
 def main():
     parser = argparse.ArgumentParser(description='Debug audio files')
     parser.add_argument('--dir', type=str, help='Directory containing audio files to analyze')
     parser.add_argument('--file', type=str, help='Specific audio file to analyze')
     parser.add_argument('--create-test', action='store_true', help='Create a test audio file')
     parser.add_argument('--output', type=str, default='test_audio.wav', help='Output path for test audio file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for --dir')
+    parser.add_argument('--report', type=str,
+                        help='Write the --dir results to this CSV file, or JSON if it ends in .json')
+    parser.add_argument('--verbose', action='store_true',
+                        help='With --dir, print the full per-file analysis instead of the summary')
     
     args = parser.parse_args()
     
@@ -109,6 +296,10 @@ def main():
             print(f"Directory does not exist: {args.dir}")
             return
         
+        if not args.verbose:
+            analyze_directory(args.dir, workers=args.workers, report=args.report)
+            return
+        
         audio_files = []
         for root, _, files in os.walk(args.dir):
             for file in files:
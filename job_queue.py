@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import kokoro_tts
+
+# Number of jobs synthesized concurrently
+WORKERS = int(os.environ.get('KOKORO_WORKERS', '2'))
+
+# Maximum number of jobs waiting for a worker before submissions are refused
+MAX_QUEUE = int(os.environ.get('KOKORO_MAX_QUEUE', '16'))
+
+# Number of finished jobs whose status is remembered for polling
+MAX_FINISHED_JOBS = 1000
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+class Job:
+    """A synthesis request tracked from submission to completion."""
+
+    def __init__(self, session_id, output_dir, params, on_segment=None, on_finish=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.output_dir = output_dir
+        self.params = params
+        self.status = 'queued'
+        self.segments_done = 0
+        # Chunk count; long chunks may still produce a few more segments
+        self.segments_total = len(kokoro_tts.split_text(
+            params['text'], params.get('chunk_policy', kokoro_tts.DEFAULT_CHUNK_POLICY)))
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._on_segment = on_segment
+        self._on_finish = on_finish
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; returns False on timeout."""
+        return self._finished.wait(timeout)
+
+    def segment_done(self, index, filename):
+        self.segments_done += 1
+        self.segments_total = max(self.segments_total, self.segments_done)
+        if self._on_segment is not None:
+            self._on_segment(index, filename)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'session_id': self.session_id,
+            'status': self.status,
+            'segments_done': self.segments_done,
+            'segments_total': self.segments_total,
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class JobQueue:
+    """Bounded queue of synthesis jobs served by a fixed pool of worker threads.
+
+    Submissions beyond max_queue waiting jobs raise QueueFull so callers can
+    push back instead of piling more work onto a saturated box.
+    """
+
+    def __init__(self, engine, workers=WORKERS, max_queue=MAX_QUEUE):
+        self.engine = engine
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._jobs = OrderedDict()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.start()
+
+    def start(self):
+        """Start the worker threads unless this process already has them.
+
+        A process forked after the queue was created, such as a gunicorn
+        worker of a preloading master, inherits no threads, so this is keyed
+        on the process id and safe to call before every use.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # The inherited queue still lists the parent's worker threads as waiters,
+                # and its pending jobs belong to the parent
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._running = 0
+            self._threads = [threading.Thread(target=self._work, name=f'synthesis-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def alive(self):
+        """Return True if every worker thread of this process is running."""
+        with self._lock:
+            return self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads)
+
+    def submit(self, session_id, output_dir, params, on_segment=None, on_finish=None):
+        """Queue a job; raises QueueFull if too many jobs are already waiting."""
+        self.start()
+        job = Job(session_id, output_dir, params, on_segment=on_segment, on_finish=on_finish)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f"{self._queue.maxsize} jobs are already waiting")
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; a running job stops after its current segment."""
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job._cancelled.set()
+        return job
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def in_flight(self):
+        with self._lock:
+            return self._running
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            try:
+                if job.is_cancelled():
+                    job.status = 'cancelled'
+                    continue
+                job.status = 'running'
+                job.started_at = time.time()
+                result = self.engine.synthesize(output_dir=job.output_dir,
+                                                on_segment=job.segment_done,
+                                                is_cancelled=job.is_cancelled,
+                                                **job.params)
+                job.result = result
+                job.segments_total = len(result['files'])
+                job.status = 'cancelled' if result.get('cancelled') else 'done'
+            except Exception as e:
+                print(f"Error in job {job.id}: {type(e).__name__}: {e}")
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._running -= 1
+                # Run the callback first so waiters see everything it records
+                if job._on_finish is not None:
+                    try:
+                        job._on_finish(job)
+                    except Exception as e:
+                        print(f"Error finishing job {job.id}: {type(e).__name__}: {e}")
+                job._finished.set()
+                self._queue.task_done()
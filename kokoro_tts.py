@@ -1,12 +1,96 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import json
+import hashlib
+import time
 import argparse
-import numpy as np
-import wave
-import soundfile as sf
+import contextlib
+import concurrent.futures
+import functools
 
-def main():
+# numpy, soundfile and wave are imported inside the functions that need them,
+# so importing this module or running --help does not pay for them
+
+SAMPLE_RATE = 24000
+
+# Paragraph split used for segmentation, as shown in the Kokoro examples
+SPLIT_PATTERN = r'\n+'
+
+# Chunking policies: "paragraph" sends each paragraph to the model whole, while
+# "adaptive" cuts the start of the first paragraph short at a sentence or clause
+# boundary so the first audio is ready sooner, then doubles the chunk size
+CHUNK_POLICIES = ('paragraph', 'adaptive')
+DEFAULT_CHUNK_POLICY = 'paragraph'
+
+# Length of the first chunk under the adaptive policy, in characters
+FIRST_CHUNK_CHARS = 100
+
+# Preferred places to cut a chunk, best first: sentence ends, clause breaks, any space
+_CHUNK_BOUNDARIES = [re.compile(pattern) for pattern in (
+    r'[.!?…]["\')\]]*\s+',
+    r'[,;:]\s+|\s[-–—]\s',
+    r'\s+',
+)]
+
+# Output formats: name -> (file extension, soundfile format, soundfile subtype, MIME type)
+OUTPUT_FORMATS = {
+    'wav': ('wav', 'WAV', 'PCM_16', 'audio/wav'),
+    'flac': ('flac', 'FLAC', 'PCM_16', 'audio/flac'),
+    'ogg': ('ogg', 'OGG', 'VORBIS', 'audio/ogg'),
+    'opus': ('opus', 'OGG', 'OPUS', 'audio/ogg'),
+    'mp3': ('mp3', 'MP3', 'MPEG_LAYER_III', 'audio/mpeg'),
+}
+DEFAULT_FORMAT = 'wav'
+
+# Single output file written when segments are stitched together, plus the format's extension
+STITCHED_BASENAME = 'audio'
+
+# Default gap and crossfade between stitched segments
+STITCH_SILENCE_MS = 200
+STITCH_CROSSFADE_MS = 10
+
+# Written into a batch item's directory once it has been synthesized
+BATCH_DONE_MARKER = '.done'
+
+# Default worker processes for --batch; each loads its own copy of the model, so keep it small
+DEFAULT_BATCH_WORKERS = min(2, os.cpu_count() or 1)
+
+# Log per-segment statistics and file checks; costs extra passes over every buffer
+DEBUG = os.environ.get('KOKORO_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Result of importing KPipeline; populated on first use by load_kpipeline_class()
+_kpipeline_class = None
+_kpipeline_import_attempted = False
+
+def available_formats():
+    """Return the output formats supported by the installed libsndfile."""
+    import soundfile as sf
+    return [name for name, (_, fmt, subtype, _) in OUTPUT_FORMATS.items() if sf.check_format(fmt, subtype)]
+
+def output_filename(basename, output_format=DEFAULT_FORMAT):
+    return f"{basename}.{OUTPUT_FORMATS[output_format][0]}"
+
+def segment_sort_key(filename):
+    """Sort key putting segment files in playback order, segment_2 before segment_10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', filename)]
+
+def mimetype_for(filename):
+    """Return the MIME type of an audio file written by this module."""
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    for ext, _, _, mimetype in OUTPUT_FORMATS.values():
+        if ext == extension:
+            return mimetype
+    return 'application/octet-stream'
+
+def write_audio(path, audio, output_format=DEFAULT_FORMAT, sample_rate=SAMPLE_RATE):
+    """Encode audio to path in one of OUTPUT_FORMATS."""
+    import soundfile as sf
+    _, fmt, subtype, _ = OUTPUT_FORMATS[output_format]
+    sf.write(path, audio, sample_rate, format=fmt, subtype=subtype)
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Kokoro Text-to-Speech Generator')
     parser.add_argument('--text', type=str, help='Text to convert to speech')
     parser.add_argument('--text-file', type=str, help='Path to a text file to convert to speech')
@@ -15,166 +99,677 @@ def main():
     parser.add_argument('--voice', type=str, default='af_heart', help='Voice to use')
     parser.add_argument('--speed', type=float, default=1.0, help='Speech speed')
     parser.add_argument('--output-dir', type=str, default='/output', help='Directory to save output files')
+    parser.add_argument('--stitch', action='store_true',
+                        help=f'Write all segments into a single {STITCHED_BASENAME} file instead of one file per segment')
+    parser.add_argument('--silence-ms', type=float, default=STITCH_SILENCE_MS,
+                        help='Silence between stitched segments in milliseconds')
+    parser.add_argument('--crossfade-ms', type=float, default=STITCH_CROSSFADE_MS,
+                        help='Crossfade at each stitched join in milliseconds')
+    parser.add_argument('--format', dest='output_format', choices=list(OUTPUT_FORMATS), default=DEFAULT_FORMAT,
+                        help='Output audio format; wav and flac are 16-bit PCM, ogg is Vorbis, opus is Ogg Opus')
+    parser.add_argument('--chunk-policy', choices=CHUNK_POLICIES, default=DEFAULT_CHUNK_POLICY,
+                        help='paragraph: one chunk per paragraph; adaptive: start with a short first chunk to get audio sooner')
+    parser.add_argument('--batch', type=str,
+                        help='Directory of .txt files or JSONL manifest to synthesize; each item gets its own subdirectory of --output-dir')
+    parser.add_argument('--workers', type=int, default=DEFAULT_BATCH_WORKERS,
+                        help='Worker processes for --batch, each keeping its own model and pipelines loaded')
+    parser.add_argument('--debug', action='store_true', default=DEBUG,
+                        help='Log per-segment audio statistics and verify every written file (also KOKORO_DEBUG=1)')
     
-    args = parser.parse_args()
-    
-    # Get text from either command line argument or file
+    args = parser.parse_args(argv)
+    if args.output_format not in available_formats():
+        parser.error(f"format {args.output_format} is not supported by the installed libsndfile")
+    return args
+
+def read_input_text(args):
+    """Get text from either command line argument or file."""
     if args.text:
-        text = args.text
-    elif args.text_file:
+        return args.text
+    if args.text_file:
         with open(args.text_file, 'r') as f:
+            return f.read()
+    
+    # Use example text if no input is provided
+    example_path = '/app/example.txt'
+    if os.path.exists(example_path):
+        with open(example_path, 'r') as f:
             text = f.read()
-    else:
-        # Use example text if no input is provided
-        example_path = '/app/example.txt'
-        if os.path.exists(example_path):
-            with open(example_path, 'r') as f:
-                text = f.read()
-            print(f"Using example text from {example_path}")
-        else:
-            text = "Hello, this is a test of the Kokoro text-to-speech system."
-            print("Using default text")
+        print(f"Using example text from {example_path}")
+        return text
     
-    # Create output directory if it doesn't exist
-    os.makedirs(args.output_dir, exist_ok=True)
+    print("Using default text")
+    return "Hello, this is a test of the Kokoro text-to-speech system."
+
+def load_kpipeline_class():
+    """Import Kokoro's KPipeline once, returning None when it is unavailable."""
+    global _kpipeline_class, _kpipeline_import_attempted
+    if _kpipeline_import_attempted:
+        return _kpipeline_class
+    _kpipeline_import_attempted = True
     
-    # Try to import Kokoro
     print("Attempting to import Kokoro module...")
     try:
         from kokoro import KPipeline
         print("Successfully imported Kokoro module")
-        using_kokoro = True
+        _kpipeline_class = KPipeline
     except ImportError as e:
         print(f"ImportError: {e}")
         print("WARNING: Using text-based audio generation fallback instead of Kokoro TTS")
-        using_kokoro = False
     except Exception as e:
         print(f"Unexpected error importing Kokoro: {type(e).__name__}: {e}")
         print("WARNING: Using text-based audio generation fallback instead of Kokoro TTS")
-        using_kokoro = False
+    return _kpipeline_class
+
+def create_pipeline(lang_code, model=None):
+    """Create a KPipeline for lang_code, or return None if Kokoro cannot be used.
+    
+    Passing an already loaded KModel shares its weights with the new pipeline
+    instead of loading another copy.
+    """
+    KPipeline = load_kpipeline_class()
+    if KPipeline is None:
+        return None
+    
+    print(f"Initializing Kokoro TTS with language code: {lang_code}")
+    try:
+        if model is not None:
+            pipeline = KPipeline(lang_code=lang_code, model=model)
+        else:
+            pipeline = KPipeline(lang_code=lang_code)
+        print("Pipeline initialized successfully")
+        return pipeline
+    except Exception as e:
+        print(f"Error initializing pipeline: {type(e).__name__}: {e}")
+        print(f"Detailed error: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def _chunk_boundary(text, limit):
+    """Return the index of the best boundary within text[:limit], or None."""
+    for pattern in _CHUNK_BOUNDARIES:
+        ends = [match.end() for match in pattern.finditer(text, 0, limit)]
+        if ends:
+            return ends[-1]
+    return None
+
+def split_text(text, chunk_policy=DEFAULT_CHUNK_POLICY, split_pattern=SPLIT_PATTERN):
+    """Split text into the chunks sent to the model one at a time.
+    
+    Both policies split on split_pattern first. "adaptive" then cuts the first
+    paragraph into chunks of at most FIRST_CHUNK_CHARS, twice that, four times
+    that and so on, each ending at the last sentence, clause or word boundary
+    that fits.
+    """
+    if chunk_policy not in CHUNK_POLICIES:
+        raise ValueError(f"Unknown chunk policy: {chunk_policy}; choose one of {', '.join(CHUNK_POLICIES)}")
+    chunks = [paragraph for paragraph in re.split(split_pattern, text.strip()) if paragraph.strip()]
+    if chunk_policy == 'paragraph' or not chunks:
+        return chunks
+    
+    first, limit = chunks[0].strip(), FIRST_CHUNK_CHARS
+    opening = []
+    while len(first) > limit:
+        cut = _chunk_boundary(first, limit)
+        if cut is None:
+            break
+        opening.append(first[:cut].strip())
+        first = first[cut:].lstrip()
+        limit *= 2
+    return opening + [first] + chunks[1:]
+
+def iter_paragraph(pipeline, paragraph, voice, speed):
+    """Run one paragraph through the pipeline, yielding (graphemes, phonemes, audio)."""
+    generator = pipeline(
+        paragraph,
+        voice=voice,
+        speed=speed,
+        split_pattern=None  # Already split by paragraphs in generate_segments
+    )
+    for gs, ps, audio in generator:
+        # Convert PyTorch tensor to NumPy array if needed
+        if hasattr(audio, 'numpy'):
+            audio = audio.numpy()
+        yield gs, ps, audio
+
+def iter_phonemes(pipeline, chunks, voice, speed):
+    """Synthesize already phonemized chunks, yielding (graphemes, phonemes, audio).
+    
+    chunks is a list of (graphemes, phonemes) from an earlier run of the
+    same pipeline; each phoneme string goes straight to the model through
+    KPipeline.generate_from_tokens, skipping G2P.
+    """
+    for gs, ps in chunks:
+        for _, _, audio in pipeline.generate_from_tokens(ps, voice, speed):
+            if hasattr(audio, 'numpy'):
+                audio = audio.numpy()
+            yield gs, ps, audio
+
+def generate_segments(pipeline, text, voice, speed, lang_code, voice_pack=None,
+                      segment_cache=None, split_pattern=SPLIT_PATTERN, is_cancelled=None,
+                      run_paragraph=None, chunk_policy=DEFAULT_CHUNK_POLICY, phoneme_cache=None):
+    """Yield (graphemes, phonemes, audio, reused) for each segment of text.
+    
+    Text is split into paragraphs (or smaller chunks, see split_text) here
+    rather than inside the pipeline so that each paragraph can be looked up
+    in segment_cache first; only paragraphs that miss are sent to the model.
+    Stops early, before the next paragraph, once is_cancelled() returns True.
+    
+    run_paragraph, if given, replaces the direct pipeline call: it receives a
+    paragraph and returns its list of (graphemes, phonemes, audio), which lets
+    a scheduler run paragraphs from several requests together.
+    
+    Paragraphs served from segment_cache still record their phonemes in
+    phoneme_cache, so other voices and speeds of them can skip G2P.
+    """
+    for paragraph in split_text(text, chunk_policy, split_pattern):
+        if is_cancelled is not None and is_cancelled():
+            return
+        
+        key = None
+        if segment_cache is not None:
+            key = segment_cache.make_key(paragraph, voice, speed, lang_code)
+            cached = segment_cache.get(key)
+            if cached is not None:
+                if phoneme_cache is not None:
+                    phoneme_cache.put(paragraph, lang_code, [(gs, ps) for gs, ps, _ in cached])
+                for gs, ps, audio in cached:
+                    yield gs, ps, audio, True
+                continue
+        
+        if run_paragraph is not None:
+            produced = run_paragraph(paragraph)
+            for gs, ps, audio in produced:
+                yield gs, ps, audio, False
+        else:
+            produced = []
+            voice_arg = voice_pack if voice_pack is not None else voice
+            for gs, ps, audio in iter_paragraph(pipeline, paragraph, voice_arg, speed):
+                produced.append((gs, ps, audio))
+                yield gs, ps, audio, False
+        
+        if key is not None:
+            segment_cache.put(key, produced)
+
+def audio_peak(audio):
+    """Return the largest absolute sample value without allocating a temporary."""
+    if audio.size == 0:
+        return 0.0
+    return max(float(audio.max()), -float(audio.min()))
+
+def normalize_audio(audio, peak=None, inplace=False):
+    """Return audio as float32, scaled up to a 0.9 peak if it is too quiet.
+    
+    Pass peak when it is already known to skip the pass that finds it. With
+    inplace, float32 audio is scaled in its own buffer instead of a copy.
+    """
+    import numpy as np
+    
+    # Ensure audio is in the correct format for soundfile
+    if audio.dtype != np.float32:
+        audio = audio.astype(np.float32)
+        inplace = True
+    
+    # Normalize audio if it's too quiet
+    if peak is None:
+        peak = audio_peak(audio)
+    if 0 < peak < 0.1:
+        scale = np.float32(0.9 / peak)
+        if inplace:
+            audio *= scale
+        else:
+            audio = audio * scale
+    return audio
+
+class StitchedWriter:
+    """Write segments one after another into a single audio file.
+    
+    Segments are streamed straight to disk with silence_ms of silence between
+    them. Each segment fades out over its last crossfade_ms into the silence
+    and the next fades in from it; without silence the two are crossfaded
+    directly. Only the last crossfade_ms of audio is held back in memory, so
+    memory use does not grow with the length of the document.
+    """
+    
+    def __init__(self, path, sample_rate=SAMPLE_RATE, silence_ms=STITCH_SILENCE_MS,
+                 crossfade_ms=STITCH_CROSSFADE_MS, output_format=DEFAULT_FORMAT):
+        import numpy as np
+        import soundfile as sf
+        self.path = path
+        self.silence = np.zeros(int(sample_rate * silence_ms / 1000), dtype=np.float32)
+        self.crossfade = int(sample_rate * crossfade_ms / 1000)
+        self.fade_in = np.linspace(0, 1, self.crossfade, dtype=np.float32)
+        self.frames = 0
+        self._tail = None
+        _, fmt, subtype, _ = OUTPUT_FORMATS[output_format]
+        # Compressed formats are encoded incrementally as segments are written
+        self._file = sf.SoundFile(path, 'w', samplerate=sample_rate, channels=1, format=fmt, subtype=subtype)
+    
+    def _write(self, audio):
+        if len(audio):
+            self._file.write(audio)
+            self.frames += len(audio)
+    
+    def _ramp(self, n):
+        """Linear 0 to 1 ramp over n samples, shortened for segments under crossfade_ms."""
+        import numpy as np
+        return self.fade_in if n == self.crossfade else np.linspace(0, 1, n, dtype=np.float32)
+    
+    def write(self, audio):
+        """Append one segment."""
+        import numpy as np
+        if self._tail is not None and len(self.silence):
+            # Fade the previous segment out into the gap and this one in from it
+            self._write(self._tail * self._ramp(len(self._tail))[::-1])
+            self._write(self.silence)
+            # A segment shorter than two fades gets both envelopes on the same samples
+            n = min(self.crossfade, len(audio))
+            audio = np.concatenate((audio[:n] * self._ramp(n), audio[n:]))
+        elif self._tail is not None:
+            # No gap, so blend the end of the previous segment with the start of this one
+            n = min(self.crossfade, len(self._tail), len(audio))
+            self._write(self._tail[:len(self._tail) - n])
+            ramp = self._ramp(n)
+            self._write(self._tail[len(self._tail) - n:] * ramp[::-1] + audio[:n] * ramp)
+            audio = audio[n:]
+        
+        # Hold back the end of the segment so it can be faded out or blended with the next one
+        keep = min(self.crossfade, len(audio))
+        self._write(audio[:len(audio) - keep])
+        self._tail = audio[len(audio) - keep:].copy()
+    
+    def close(self):
+        if self._tail is not None:
+            self._write(self._tail)
+            self._tail = None
+        self._file.close()
+
+def _timed(iterable, timings, stage):
+    """Yield from iterable, adding the time spent producing each item to timings[stage]."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[stage] += time.perf_counter() - start
+        yield item
+
+def synthesize(text, output_dir, lang_code='a', voice='af_heart', speed=1.0, pipeline=None,
+               voice_pack=None, segment_cache=None, on_segment=None, is_cancelled=None,
+               run_paragraph=None, stitch=False, silence_ms=STITCH_SILENCE_MS,
+               crossfade_ms=STITCH_CROSSFADE_MS, output_format=DEFAULT_FORMAT,
+               chunk_policy=DEFAULT_CHUNK_POLICY, debug=None, phoneme_cache=None):
+    """Synthesize text into segment_N files inside output_dir.
+    
+    The caller owns the pipeline so that it can be kept resident between calls;
+    when pipeline is None the text-based fallback is used instead of Kokoro.
+    voice_pack is an already loaded voice tensor to use in place of the voice name,
+    and segment_cache lets unchanged paragraphs skip the model. on_segment is
+    called with (index, filename) as soon as each segment file is written, and
+    synthesis stops before the next segment once is_cancelled() returns True.
+    run_paragraph and phoneme_cache are passed through to generate_segments.
+    With stitch, all segments go into a single audio file through
+    StitchedWriter instead, and on_segment is only called once that file is
+    complete. output_format picks
+    one of OUTPUT_FORMATS for every file written and chunk_policy one of
+    CHUNK_POLICIES. debug (default DEBUG) logs per-segment statistics and
+    checks each written file.
+    Returns a dict with the generated file names, whether Kokoro was used, how
+    many segments came from the segment cache, the seconds of audio produced
+    and timings: seconds spent in the model ('synthesis') and in normalizing,
+    encoding and writing files ('write').
+    """
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    debug = DEBUG if debug is None else debug
+    stitched_filename = output_filename(STITCHED_BASENAME, output_format)
+    
+    files = []
+    segments_reused = 0
+    cancelled = False
+    using_kokoro = pipeline is not None
+    timings = {'synthesis': 0.0, 'write': 0.0}
+    audio_seconds = 0.0
     
     if using_kokoro:
         try:
-            # Initialize the pipeline
-            print(f"Initializing Kokoro TTS with language code: {args.lang_code}")
+            # Generate audio
+            print(f"Generating audio with voice: {voice}, speed: {speed}")
             try:
-                # Initialize the pipeline
-                pipeline = KPipeline(lang_code=args.lang_code)
-                print("Pipeline initialized successfully")
+                # Split text by paragraphs to improve processing
+                generator = generate_segments(pipeline, text, voice, speed, lang_code,
+                                              voice_pack=voice_pack, segment_cache=segment_cache,
+                                              is_cancelled=is_cancelled, run_paragraph=run_paragraph,
+                                              chunk_policy=chunk_policy, phoneme_cache=phoneme_cache)
+                if debug:
+                    print("Generator created successfully")
             except Exception as e:
-                print(f"Error initializing pipeline: {type(e).__name__}: {e}")
-                print(f"Detailed error: {e}")
-                import traceback
-                traceback.print_exc()
+                print(f"Error creating generator: {type(e).__name__}: {e}")
                 using_kokoro = False
             
-            if using_kokoro:
-                # Generate audio
-                print(f"Generating audio with voice: {args.voice}, speed: {args.speed}")
-                try:
-                    # Split text by paragraphs to improve processing
-                    generator = pipeline(
-                        text,
-                        voice=args.voice,
-                        speed=args.speed,
-                        split_pattern=r'\n+'  # Split by paragraphs as shown in the example
-                    )
-                    print("Generator created successfully")
-                except Exception as e:
-                    print(f"Error creating generator: {type(e).__name__}: {e}")
-                    using_kokoro = False
-            
             if using_kokoro:
                 # Process and save each audio segment
-                print("Processing audio segments...")
+                if debug:
+                    print("Processing audio segments...")
                 segment_count = 0
+                writer = None
                 try:
-                    for i, (gs, ps, audio) in enumerate(generator):
+                    if stitch:
+                        writer = StitchedWriter(os.path.join(output_dir, stitched_filename),
+                                                silence_ms=silence_ms, crossfade_ms=crossfade_ms,
+                                                output_format=output_format)
+                    for i, (gs, ps, audio, reused) in enumerate(_timed(generator, timings, 'synthesis')):
+                        if is_cancelled is not None and is_cancelled():
+                            print("Synthesis cancelled")
+                            cancelled = True
+                            break
                         segment_count += 1
-                        print(f"Segment {i}:")
-                        print(f"Text: {gs}")
-                        print(f"Audio shape: {audio.shape}, dtype: {audio.dtype}")
-                        print(f"Audio min: {audio.min()}, max: {audio.max()}, mean: {audio.mean()}")
-                        
-                        # Check if audio contains actual sound or just silence
-                        if abs(audio.max() - audio.min()) < 0.01:
-                            print("WARNING: Audio appears to be silent or nearly silent!")
+                        audio_seconds += len(audio) / SAMPLE_RATE
+                        if reused:
+                            segments_reused += 1
+                        peak = None
+                        if debug:
+                            low, high = float(audio.min()), float(audio.max())
+                            peak = max(high, -low)
+                            print(f"Segment {i}{' (reused from cache)' if reused else ''}:")
+                            print(f"Text: {gs}")
+                            print(f"Audio shape: {audio.shape}, dtype: {audio.dtype}")
+                            print(f"Audio min: {low}, max: {high}, mean: {audio.mean()}")
+                            
+                            # Check if audio contains actual sound or just silence
+                            if high - low < 0.01:
+                                print("WARNING: Audio appears to be silent or nearly silent!")
                         
                         # Save audio file
-                        output_path = os.path.join(args.output_dir, f'segment_{i}.wav')
+                        filename = output_filename(f'segment_{i}', output_format)
+                        output_path = os.path.join(output_dir, filename)
+                        write_start = time.perf_counter()
                         try:
-                            # Ensure audio is in the correct format for soundfile
-                            # Convert PyTorch tensor to NumPy array if needed
-                            if hasattr(audio, 'numpy'):
-                                print(f"Converting PyTorch tensor to NumPy array")
-                                audio = audio.numpy()
+                            # Fresh buffers belong to this call; cached ones are shared with other requests
+                            audio = normalize_audio(audio, peak=peak, inplace=not reused)
                             
-                            if audio.dtype != np.float32:
-                                print(f"Converting audio from {audio.dtype} to float32")
-                                audio = audio.astype(np.float32)
-                            
-                            # Normalize audio if it's too quiet
-                            if abs(audio.max()) < 0.1:
-                                print("Audio level is low, normalizing...")
-                                if abs(audio.max()) > 0:  # Avoid division by zero
-                                    audio = audio / abs(audio.max()) * 0.9
+                            if writer is not None:
+                                writer.write(audio)
+                                timings['write'] += time.perf_counter() - write_start
+                                if debug:
+                                    print(f"Appended to {writer.path}")
+                                    print("-" * 50)
+                                continue
                             
                             # Write audio file
-                            sf.write(output_path, audio, 24000)
-                            print(f"Saved to {output_path}")
+                            write_audio(output_path, audio, output_format)
+                            timings['write'] += time.perf_counter() - write_start
+                            files.append(filename)
+                            if on_segment is not None:
+                                on_segment(i, filename)
                             
                             # Verify the file was created and has content
-                            if os.path.exists(output_path):
-                                file_size = os.path.getsize(output_path)
-                                print(f"File size: {file_size} bytes")
-                                if file_size < 100:
-                                    print("WARNING: Audio file is suspiciously small!")
-                            else:
-                                print("ERROR: File was not created!")
+                            if debug:
+                                print(f"Saved to {output_path}")
+                                if os.path.exists(output_path):
+                                    file_size = os.path.getsize(output_path)
+                                    print(f"File size: {file_size} bytes")
+                                    if file_size < 100:
+                                        print("WARNING: Audio file is suspiciously small!")
+                                else:
+                                    print("ERROR: File was not created!")
                         except Exception as e:
                             print(f"Error saving audio file: {type(e).__name__}: {e}")
-                            print(f"Error details: {e}")
                         
-                        print("-" * 50)
+                        if debug:
+                            print("-" * 50)
+                    
+                    if is_cancelled is not None and is_cancelled():
+                        cancelled = True
                     
-                    if segment_count == 0:
+                    if writer is not None:
+                        write_start = time.perf_counter()
+                        writer.close()
+                        timings['write'] += time.perf_counter() - write_start
+                        if segment_count > 0:
+                            print(f"Stitched {segment_count} segments into {writer.path} "
+                                  f"({writer.frames / SAMPLE_RATE:.2f} seconds)")
+                            files.append(stitched_filename)
+                            if on_segment is not None:
+                                on_segment(0, stitched_filename)
+                        writer = None
+                    if segment_count == 0 and not cancelled:
                         print("WARNING: No audio segments were generated! Using fallback.")
                         using_kokoro = False
                         
                 except Exception as e:
                     print(f"Error processing audio segments: {type(e).__name__}: {e}")
                     using_kokoro = False
+                    if writer is not None:
+                        writer.close()
         except Exception as e:
             print(f"Error using Kokoro: {type(e).__name__}: {e}")
             using_kokoro = False
     
     # If Kokoro failed or is not available, use the fallback
-    if not using_kokoro:
+    if not using_kokoro and not cancelled:
         print("Using text-based audio generation fallback.")
+        segments_reused = 0
+        audio_seconds = 0.0
         # Create a fallback audio file with tones
-        output_path = os.path.join(args.output_dir, 'segment_0.wav')
+        filename = stitched_filename if stitch else output_filename('segment_0', output_format)
+        output_path = os.path.join(output_dir, filename)
         
         # Create a text-to-tone representation based on the input text
         # This will create a unique audio pattern for each text input
-        create_text_based_audio(output_path, text)
+        fallback_start = time.perf_counter()
+        create_text_based_audio(output_path, text, output_format=output_format)
+        timings['synthesis'] += time.perf_counter() - fallback_start
+        import soundfile as sf
+        audio_seconds = sf.info(output_path).duration
         print(f"Created text-based audio file at {output_path}")
-        print(f"File size: {os.path.getsize(output_path)} bytes")
+        if debug:
+            print(f"File size: {os.path.getsize(output_path)} bytes")
+        if filename not in files:
+            files.append(filename)
+        if on_segment is not None:
+            on_segment(0, filename)
+    
+    print(f"Audio generation complete: {len(files)} file(s) in {output_dir}")
+    return {'files': files, 'using_kokoro': using_kokoro, 'segments_reused': segments_reused,
+            'cancelled': cancelled, 'audio_seconds': audio_seconds, 'timings': timings}
+
+def load_batch_items(path, lang_code='a', voice='af_heart', speed=1.0):
+    """Return the batch items described by path.
+    
+    path is either a directory, where every .txt file below it is one item
+    named after its relative path, or a JSONL manifest with one object per
+    line holding "text" or "text_file" and optionally "id", "lang_code",
+    "voice" and "speed". Missing fields take the command line defaults.
+    """
+    items = []
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for file in sorted(files):
+                if file.endswith('.txt'):
+                    file_path = os.path.join(root, file)
+                    item_id = os.path.splitext(os.path.relpath(file_path, path))[0]
+                    items.append({'id': item_id, 'text_file': file_path})
+        items.sort(key=lambda item: item['id'])
+    else:
+        base_dir = os.path.dirname(os.path.abspath(path))
+        with open(path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                item.setdefault('id', str(line_number))
+                if 'text_file' in item and not os.path.isabs(item['text_file']):
+                    item['text_file'] = os.path.join(base_dir, item['text_file'])
+                items.append(item)
     
-    print("Audio generation complete!")
+    for item in items:
+        item['id'] = str(item['id']).replace(os.sep, '__')
+        item.setdefault('lang_code', lang_code)
+        item.setdefault('voice', voice)
+        item['speed'] = float(item.get('speed', speed))
+    return items
+
+# Pipelines loaded by a batch worker process, keyed by lang_code
+_worker_pipelines = {}
+
+def _init_batch_worker(threads):
+    """Share the CPU cores between worker processes instead of each model using all of them."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+def _run_batch_item(item, output_dir, output_options):
+    """Synthesize one batch item in a worker process and record its timing."""
+    item_dir = os.path.join(output_dir, item['id'])
+    done_marker = os.path.join(item_dir, BATCH_DONE_MARKER)
+    os.makedirs(item_dir, exist_ok=True)
+    
+    start = time.perf_counter()
+    summary = {'id': item['id'], 'status': 'failed', 'seconds': 0.0, 'files': []}
+    # Keep the per-segment output of each item in its own log instead of interleaving it
+    with open(os.path.join(item_dir, 'log.txt'), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            if 'text' in item:
+                text = item['text']
+            else:
+                with open(item['text_file'], 'r') as f:
+                    text = f.read()
+            
+            lang_code = item['lang_code']
+            if lang_code not in _worker_pipelines:
+                _worker_pipelines[lang_code] = create_pipeline(lang_code, model=next(
+                    (p.model for p in _worker_pipelines.values() if p is not None), None))
+            result = synthesize(text, item_dir, lang_code=lang_code, voice=item['voice'],
+                                speed=item['speed'], pipeline=_worker_pipelines[lang_code],
+                                **output_options)
+            summary.update(files=result['files'], using_kokoro=result['using_kokoro'])
+            # Fallback tones from a failing Kokoro must be redone when the run is resumed
+            if _worker_pipelines[lang_code] is not None and not result['using_kokoro']:
+                summary['error'] = "Kokoro failed; only fallback audio was written"
+            else:
+                summary['status'] = 'done'
+        except Exception as e:
+            print(f"Error processing batch item: {type(e).__name__}: {e}")
+            summary['error'] = f"{type(e).__name__}: {e}"
+    
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    if summary['status'] == 'done':
+        with open(done_marker, 'w') as f:
+            json.dump(summary, f)
+    return summary
+
+def run_batch(path, output_dir, workers=1, lang_code='a', voice='af_heart', speed=1.0,
+              **output_options):
+    """Synthesize every item of a batch with a pool of worker processes.
+    
+    Items whose output directory already holds a completion marker are
+    skipped, so an interrupted run can simply be started again. Items that
+    only got fallback audio because Kokoro failed get no marker. Each
+    worker's model threads are limited to its share of the CPU cores. A summary
+    with per-item timings is printed and written to batch_summary.json.
+    output_options (output_format, stitch, silence_ms, crossfade_ms, chunk_policy,
+    debug) are passed to synthesize() for every item. Returns the number of failed items.
+    """
+    items = load_batch_items(path, lang_code=lang_code, voice=voice, speed=speed)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    summaries = []
+    pending = []
+    for item in items:
+        done_marker = os.path.join(output_dir, item['id'], BATCH_DONE_MARKER)
+        if os.path.exists(done_marker):
+            summaries.append({'id': item['id'], 'status': 'skipped'})
+        else:
+            pending.append(item)
+    print(f"Batch: {len(items)} items, {len(items) - len(pending)} already done, "
+          f"{len(pending)} to synthesize with {workers} workers")
+    
+    start = time.perf_counter()
+    if pending:
+        workers = max(1, workers)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                                    initargs=(threads,)) as executor:
+            futures = {executor.submit(_run_batch_item, item, output_dir, output_options): item for item in pending}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    summary = {'id': item['id'], 'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+                summaries.append(summary)
+                print(f"[{len(summaries)}/{len(items)}] {summary['id']}: {summary['status']}"
+                      f" ({summary.get('seconds', 0.0):.2f}s)")
+    elapsed = time.perf_counter() - start
+    
+    counts = {status: sum(1 for s in summaries if s['status'] == status)
+              for status in ('done', 'skipped', 'failed')}
+    report = {'total': len(items), 'seconds': round(elapsed, 3), **counts,
+              'items': sorted(summaries, key=lambda s: s['id'])}
+    with open(os.path.join(output_dir, 'batch_summary.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"Batch complete in {elapsed:.2f}s: {counts['done']} done, {counts['skipped']} skipped, "
+          f"{counts['failed']} failed")
+    timed = [s['seconds'] for s in summaries if s['status'] == 'done']
+    if timed:
+        print(f"Per-item time: min {min(timed):.2f}s, mean {sum(timed) / len(timed):.2f}s, max {max(timed):.2f}s")
+    return counts['failed']
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_options = {
+        'output_format': args.output_format,
+        'stitch': args.stitch,
+        'silence_ms': args.silence_ms,
+        'crossfade_ms': args.crossfade_ms,
+        'chunk_policy': args.chunk_policy,
+        'debug': args.debug
+    }
+    if args.batch:
+        failed = run_batch(args.batch, args.output_dir, workers=args.workers, lang_code=args.lang_code,
+                           voice=args.voice, speed=args.speed, **output_options)
+        return 1 if failed else 0
+    
+    text = read_input_text(args)
+    
+    pipeline = create_pipeline(args.lang_code)
+    synthesize(text, args.output_dir, lang_code=args.lang_code, voice=args.voice,
+               speed=args.speed, pipeline=pipeline, **output_options)
     return 0
 
-def create_text_based_audio(filename, text, duration=None):
-    """Create a WAV file with audio patterns based on the input text."""
-    sample_rate = 24000
+_BLIP_WIDTH = SAMPLE_RATE // 50  # 20ms blip
+_FADE_SAMPLES = int(0.1 * SAMPLE_RATE)  # 100ms fade
+
+@functools.lru_cache(maxsize=None)
+def _fallback_tables():
+    """Return the blip envelope and fade curves for text_based_audio(), computed on first use."""
+    import numpy as np
+    blip_envelope = np.sin(np.pi * np.linspace(0, 1, _BLIP_WIDTH)).astype(np.float32)
+    fade_in = np.linspace(0, 1, _FADE_SAMPLES).astype(np.float32)
+    return blip_envelope, fade_in, fade_in[::-1].copy()
+
+def text_based_audio(text, duration=None):
+    """Return float32 audio with a pattern derived from the text.
+    
+    The pattern depends only on the text (and duration), so the same text
+    always gives the same samples. Everything is computed in a few
+    vectorized passes without touching the global NumPy random state.
+    """
+    import numpy as np
+    blip_envelope, fade_in, fade_out = _fallback_tables()
+    sample_rate = SAMPLE_RATE
     
     # Use text to determine audio characteristics
     # Hash the text to get consistent results for the same text
-    import hashlib
     text_hash = int(hashlib.md5(text.encode()).hexdigest(), 16)
     
-    # Use the hash to seed the random number generator for consistent results
-    np.random.seed(text_hash % 2**32)
-    
     # Determine duration based on text length (minimum 2 seconds, maximum 10 seconds)
     if duration is None:
         text_length = len(text)
@@ -184,14 +779,10 @@ def create_text_based_audio(filename, text, duration=None):
     num_samples = int(duration * sample_rate)
     
     # Create time array
-    t = np.linspace(0, duration, num_samples, endpoint=False)
-    
-    # Generate audio based on text characteristics
-    audio = np.zeros(num_samples, dtype=np.float32)
+    t = np.arange(num_samples, dtype=np.float32) * np.float32(duration / num_samples)
     
     # Extract some features from the text
     word_count = len(text.split())
-    char_count = len(text)
     
     # Use text features to determine base frequency (between 220Hz and 880Hz)
     base_freq = 220 + (text_hash % 660)
@@ -200,60 +791,60 @@ def create_text_based_audio(filename, text, duration=None):
     # More words = more complex chord
     chord_complexity = min(5, max(2, word_count // 10 + 2))
     
-    # Generate frequencies for the chord
-    frequencies = []
-    for i in range(chord_complexity):
-        # Use different parts of the hash for different frequencies
-        freq_factor = 1.0 + (0.2 * ((text_hash >> (i * 8)) % 256) / 256)
-        frequencies.append(base_freq * freq_factor)
-    
-    # Add the frequencies to the audio
-    for i, freq in enumerate(frequencies):
-        # Vary amplitude based on position in the chord
-        amplitude = 0.3 / (i + 1)
-        audio += amplitude * np.sin(2 * np.pi * freq * t)
-    
-    # Add some variation based on the text content
-    for i, char in enumerate(text[:min(len(text), 100)]):  # Limit to first 100 chars
-        if i >= len(t):
-            break
-            
-        # Use character ASCII value to create small variations
-        char_val = ord(char)
-        if char_val > 64 and char_val < 128:  # Only for standard ASCII
-            # Add a small blip at positions corresponding to characters
-            pos = int((i / min(len(text), 100)) * num_samples)
-            width = sample_rate // 50  # 20ms blip
-            if pos + width < num_samples:
-                # Create a small envelope
-                envelope = np.sin(np.pi * np.linspace(0, 1, width))
-                # Frequency based on character value
-                freq = 440 + (char_val - 65) * 20  # Map A-Z to different frequencies
-                blip = 0.1 * envelope * np.sin(2 * np.pi * freq * t[pos:pos+width])
-                audio[pos:pos+width] += blip
+    # Use different parts of the hash for different frequencies, and vary
+    # amplitude based on position in the chord
+    freq_factors = np.array([1.0 + 0.2 * ((text_hash >> (i * 8)) % 256) / 256 for i in range(chord_complexity)])
+    positions = np.arange(chord_complexity)
+    omegas = (2 * np.pi * base_freq * freq_factors).astype(np.float32)
+    amplitudes = (0.3 / (positions + 1)).astype(np.float32)
+    audio = amplitudes @ np.sin(np.multiply.outer(omegas, t))
     
-    # Apply fade in and fade out
-    fade_samples = int(0.1 * sample_rate)  # 100ms fade
-    fade_in = np.linspace(0, 1, fade_samples)
-    fade_out = np.linspace(1, 0, fade_samples)
+    # Add a small blip for each standard ASCII character among the first 100
+    n_chars = min(len(text), 100)
+    char_vals = np.frombuffer(text[:n_chars].encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    char_index = np.arange(n_chars)
+    starts = ((char_index / max(n_chars, 1)) * num_samples).astype(np.int64)
+    blips = (char_vals > 64) & (char_vals < 128) & (starts + _BLIP_WIDTH < num_samples)
+    if blips.any():
+        starts = starts[blips]
+        # Frequency based on character value
+        blip_omegas = (2 * np.pi * (440 + (char_vals[blips] - 65) * 20)).astype(np.float32)
+        index = starts[:, None] + np.arange(_BLIP_WIDTH)
+        values = np.float32(0.1) * blip_envelope * np.sin(blip_omegas[:, None] * t[index])
+        if len(starts) < 2 or np.diff(starts).min() >= _BLIP_WIDTH:
+            audio[index] += values
+        else:
+            # Blips overlap when an explicit short duration is requested
+            np.add.at(audio, index, values)
     
-    audio[:fade_samples] *= fade_in
-    audio[-fade_samples:] *= fade_out
+    # Apply fade in and fade out
+    fade_samples = min(_FADE_SAMPLES, num_samples)
+    audio[:fade_samples] *= fade_in[:fade_samples]
+    audio[-fade_samples:] *= fade_out[_FADE_SAMPLES - fade_samples:]
     
     # Normalize
-    if np.max(np.abs(audio)) > 0:
-        audio = audio / np.max(np.abs(audio)) * 0.9
+    peak = np.abs(audio).max() if num_samples else 0
+    if peak > 0:
+        audio *= np.float32(0.9) / peak
     
-    # Convert to float32 for soundfile
-    audio = audio.astype(np.float32)
+    return audio
+
+def create_text_based_audio(filename, text, duration=None, output_format=DEFAULT_FORMAT):
+    """Create an audio file with audio patterns based on the input text."""
+    sample_rate = SAMPLE_RATE
+    audio = text_based_audio(text, duration)
     
     # Write using soundfile for better quality
     try:
-        sf.write(filename, audio, sample_rate)
+        write_audio(filename, audio, output_format, sample_rate)
         print(f"Audio saved to {filename} using soundfile")
         return True
     except Exception as e:
+        if output_format != 'wav':
+            raise
         print(f"Error saving with soundfile: {e}, falling back to wave module")
+        import numpy as np
+        import wave
         
         # Convert to int16 for wave module
         audio_int16 = (audio * 32767).astype(np.int16)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import bisect
+import threading
+
+# Default histogram buckets in seconds, from a resident-cache hit to a long document
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a dict mapping label values (a tuple,
+    or a plain value for a single label) to numbers.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, help, callback, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        _registry.append(self)
+
+    def samples(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            yield self.name, '', value
+            return
+        for key, item in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, _format_labels(self.labels, key), item
+
+class Histogram:
+    """Cumulative histogram of observed values."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield f'{self.name}_bucket', _format_labels((), (), [('le', _format_value(bound))]), cumulative
+        yield f'{self.name}_sum', '', total
+        yield f'{self.name}_count', '', cumulative
+
+def render():
+    """Return every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+HTTP_REQUESTS = Counter('kokoro_http_requests_total', 'HTTP requests by endpoint and status code',
+                        labels=('endpoint', 'status'))
+PIPELINE_LOAD_SECONDS = Histogram('kokoro_pipeline_load_seconds', 'Time spent loading a language pipeline')
+SYNTHESIS_SECONDS = Histogram('kokoro_synthesis_seconds', 'Model time per synthesized request')
+WRITE_SECONDS = Histogram('kokoro_write_seconds', 'Encoding and file write time per synthesized request')
+GENERATE_SECONDS = Histogram('kokoro_generate_seconds', 'End-to-end engine time per request, cache hits included')
+AUDIO_SECONDS = Counter('kokoro_audio_seconds_total', 'Seconds of audio produced')
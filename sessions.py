@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from werkzeug.security import safe_join
+
+from kokoro_tts import segment_sort_key
+
+# Directories holding session output and uploaded text files
+OUTPUT_DIR = 'output'
+INPUT_DIR = 'input'
+
+# Hours a finished session is kept before its files are deleted (0 keeps them forever)
+SESSION_TTL_HOURS = float(os.environ.get('KOKORO_SESSION_TTL_HOURS', '24'))
+
+# Disk budget for all session output in megabytes; oldest sessions go first (0 disables it)
+OUTPUT_QUOTA_MB = float(os.environ.get('KOKORO_OUTPUT_QUOTA_MB', '0'))
+
+# Seconds between janitor sweeps
+JANITOR_INTERVAL = float(os.environ.get('KOKORO_JANITOR_INTERVAL', '300'))
+
+# Number of evicted session ids remembered so their URLs answer 410 instead of 404
+MAX_EXPIRED_SESSIONS = 10000
+
+class _Session:
+    def __init__(self, created, files=(), size=0, active=False):
+        self.created = created
+        self.files = list(files)
+        self.size = size
+        self.active = active
+        self.etags = {}
+
+def _scan(session_dir, extensions):
+    """Return (audio file names, total bytes) for a session directory."""
+    files, size = [], 0
+    try:
+        entries = list(os.scandir(session_dir))
+    except OSError:
+        return files, size
+    for entry in entries:
+        try:
+            size += entry.stat().st_size
+        except OSError:
+            continue
+        if entry.name.endswith(extensions):
+            files.append(entry.name)
+    return sorted(files, key=segment_sort_key), size
+
+def _content_hash(path=None, data=None):
+    digest = hashlib.sha256()
+    if data is not None:
+        digest.update(data)
+    else:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()[:32]
+
+class SessionStore:
+    """In-memory index of session directories with a background janitor.
+
+    Sessions are registered when a request creates them and scanned once
+    when their job finishes, so listing a finished session never touches the
+    filesystem. A janitor thread deletes finished sessions older than
+    ttl_hours and, once the total size exceeds quota_mb, the oldest finished
+    sessions until it fits again. Ids of deleted sessions are remembered so
+    callers can tell an expired session from one that never existed.
+    """
+
+    def __init__(self, extensions, output_dir=OUTPUT_DIR, input_dir=INPUT_DIR,
+                 ttl_hours=SESSION_TTL_HOURS, quota_mb=OUTPUT_QUOTA_MB, interval=JANITOR_INTERVAL):
+        self.extensions = tuple(extensions)
+        self.output_dir = output_dir
+        self.input_dir = input_dir
+        self.ttl = ttl_hours * 3600
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.interval = max(1.0, interval)
+        self.evicted = 0
+        self._sessions = OrderedDict()  # session_id -> _Session, oldest first
+        self._expired = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._janitor_pid = None
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._load_index()
+        self.start()
+
+    def start(self):
+        """Start the janitor thread unless this process already has one, e.g. after a fork."""
+        with self._lock:
+            if self._janitor_pid == os.getpid():
+                return
+            self._janitor_pid = os.getpid()
+            threading.Thread(target=self._janitor, name='session-janitor', daemon=True).start()
+
+    def _load_index(self):
+        sessions = []
+        for entry in os.scandir(self.output_dir):
+            try:
+                uuid.UUID(entry.name)
+            except ValueError:
+                # Not a session, e.g. the audio cache or batch output
+                continue
+            if not entry.is_dir():
+                continue
+            files, size = _scan(entry.path, self.extensions)
+            sessions.append((entry.stat().st_mtime, entry.name, files, size))
+        for created, session_id, files, size in sorted(sessions):
+            self._sessions[session_id] = _Session(created, files, size)
+            self._bytes += size
+
+    def create(self):
+        """Register a new session and return (session_id, session_output_dir)."""
+        self.start()
+        session_id = str(uuid.uuid4())
+        session_dir = self.path(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        with self._lock:
+            self._sessions[session_id] = _Session(time.time(), active=True)
+        return session_id, session_dir
+
+    def path(self, session_id):
+        return os.path.join(self.output_dir, session_id)
+
+    def upload_path(self, session_id):
+        return os.path.join(self.input_dir, f"{session_id}.txt")
+
+    def finish(self, session_id):
+        """Record the files of a session whose job has ended."""
+        files, size = _scan(self.path(session_id), self.extensions)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            self._bytes += size - session.size
+            session.files, session.size, session.active = files, size, False
+            over_quota = 0 < self.quota_bytes < self._bytes
+        if over_quota:
+            self._wake.set()
+
+    def files(self, session_id):
+        """Return the audio files of a session, or None if it is unknown or expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if not session.active:
+                return list(session.files)
+        # Still being written, so whatever is on disk so far
+        return _scan(self.path(session_id), self.extensions)[0]
+
+    def file_path(self, session_id, filename):
+        """Return the path of a file in a known session, or None if it is unknown or unsafe."""
+        with self._lock:
+            if session_id not in self._sessions:
+                return None
+        return safe_join(self.output_dir, session_id, filename)
+
+    def written(self, session_id, filename):
+        """Record the etag of a file a running job has finished writing."""
+        path = self.file_path(session_id, filename)
+        if path is None:
+            return
+        try:
+            etag = _content_hash(path)
+        except OSError:
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.etags[filename] = etag
+
+    def file_info(self, session_id, filename, data=None):
+        """Return (etag, immutable) for a session file, or None if there is no such file.
+
+        The etag is a hash of the file's content, recorded by written() as
+        each file is completed, so serving never rereads the file. Files
+        without a recorded etag are hashed here: a finished session's are
+        then remembered, while an unannounced file of a running session may
+        still be growing and is not immutable. data holds the file's bytes
+        when they are already in memory and is hashed instead of reading the
+        file.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            finished = not session.active
+            if finished and filename not in session.files:
+                return None
+            etag = session.etags.get(filename)
+            if etag is not None:
+                return etag, True
+
+        if data is None:
+            path = self.file_path(session_id, filename)
+            if path is None or not os.path.isfile(path):
+                return None
+            try:
+                etag = _content_hash(path)
+            except OSError:
+                return None
+        else:
+            etag = _content_hash(data=data)
+        if finished:
+            with self._lock:
+                session.etags[filename] = etag
+        return etag, finished
+
+    def is_expired(self, session_id):
+        with self._lock:
+            return session_id in self._expired
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._sessions), 'bytes': self._bytes, 'evicted': self.evicted}
+
+    def sweep(self, now=None):
+        """Delete expired sessions and enforce the quota; returns the number removed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            doomed = []
+            total = self._bytes
+            for session_id, session in self._sessions.items():
+                if session.active:
+                    continue
+                if (0 < self.ttl and session.created + self.ttl < now) or 0 < self.quota_bytes < total:
+                    doomed.append(session_id)
+                    total -= session.size
+            for session_id in doomed:
+                self._bytes -= self._sessions.pop(session_id).size
+                self._expired[session_id] = now
+            while len(self._expired) > MAX_EXPIRED_SESSIONS:
+                self._expired.popitem(last=False)
+            self.evicted += len(doomed)
+
+        for session_id in doomed:
+            shutil.rmtree(self.path(session_id), ignore_errors=True)
+            try:
+                os.remove(self.upload_path(session_id))
+            except OSError:
+                pass
+        if doomed:
+            print(f"Janitor removed {len(doomed)} session(s)")
+        return len(doomed)
+
+    def _janitor(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error cleaning up sessions: {type(e).__name__}: {e}")
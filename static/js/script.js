@@ -18,6 +18,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Current session data
     let currentSessionId = null;
     let currentFiles = [];
+    let playlist = [];
+    let waitingForNext = false;
     
     // Language code to voice prefix mapping
     const langCodeToPrefix = {
@@ -125,6 +127,10 @@ document.addEventListener('DOMContentLoaded', function() {
         statusMessage.innerHTML = '';
         statusMessage.className = '';
         downloadAllBtn.style.display = 'none';
+        currentSessionId = null;
+        currentFiles = [];
+        playlist = [];
+        waitingForNext = false;
         
         // Show loading indicator
         loading.style.display = 'block';
@@ -134,45 +140,24 @@ document.addEventListener('DOMContentLoaded', function() {
         // Create form data
         const formData = new FormData(form);
         
-        // Send request
-        fetch('/generate', {
+        // Send request and play segments as the server streams them
+        fetch('/generate/stream', {
             method: 'POST',
             body: formData
         })
-        .then(response => response.json())
-        .then(data => {
-            // Hide loading indicator
-            loading.style.display = 'none';
-            results.style.display = 'block';
-            generateBtn.disabled = false;
-            
-            if (data.success) {
-                // Store session data
-                currentSessionId = data.session_id;
-                currentFiles = data.files;
-                
-                // Show success message
-                statusMessage.innerHTML = `<p>Audio generated successfully!</p>`;
-                statusMessage.className = 'success';
-                
-                // Display audio files
-                if (data.files && data.files.length > 0) {
-                    data.files.forEach(file => {
-                        createAudioElement(data.session_id, file);
-                    });
-                    
-                    // Show download all button if multiple files
-                    if (data.files.length > 1) {
-                        downloadAllBtn.style.display = 'block';
-                    }
+        .then(response => {
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.startsWith('text/event-stream')) {
+                // Errors before synthesis starts come back as plain JSON
+                return response.json().then(data => handleDone(data));
+            }
+            return readEventStream(response, function(event, data) {
+                if (event === 'segment') {
+                    handleSegment(data);
                 } else {
-                    audioContainer.innerHTML = '<p>No audio files were generated.</p>';
+                    handleDone(data);
                 }
-            } else {
-                // Show error message
-                statusMessage.innerHTML = `<p>Error: ${data.error || 'Unknown error occurred'}</p>`;
-                statusMessage.className = 'error';
-            }
+            });
         })
         .catch(error => {
             // Hide loading indicator
@@ -186,6 +171,115 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Parse a server-sent event stream from a fetch response
+    function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) {
+                            event = line.slice(7);
+                        } else if (line.startsWith('data: ')) {
+                            data += line.slice(6);
+                        }
+                    });
+                    onEvent(event, JSON.parse(data));
+                }
+                return pump();
+            });
+        }
+        return pump();
+    }
+    
+    // Show a segment as soon as it has been generated
+    function handleSegment(segment) {
+        if (playlist.length === 0) {
+            // First audio is ready: swap the spinner for the results
+            loading.style.display = 'none';
+            results.style.display = 'block';
+            statusMessage.innerHTML = '<p>Generating remaining segments...</p>';
+        }
+        const sessionId = segment.url.split('/')[2];
+        const audio = createAudioElement(sessionId, segment.file);
+        playlist.push(audio);
+        
+        if (playlist.length === 1 || waitingForNext) {
+            waitingForNext = false;
+            playAudio(audio);
+        }
+    }
+    
+    // Show the final result once every segment is done
+    function handleDone(data) {
+        // Hide loading indicator
+        loading.style.display = 'none';
+        results.style.display = 'block';
+        generateBtn.disabled = false;
+        waitingForNext = false;
+        
+        if (data.success) {
+            // Store session data
+            currentSessionId = data.session_id;
+            currentFiles = data.files;
+            
+            // Show success message
+            statusMessage.innerHTML = `<p>Audio generated successfully!</p>`;
+            if (data.segments_reused > 0) {
+                statusMessage.innerHTML += `<p>${data.segments_reused} of ${data.files.length} segments reused from cache.</p>`;
+            }
+            statusMessage.className = 'success';
+            
+            // Display any audio files that were not streamed
+            const streamed = playlist.length;
+            data.files.slice(streamed).forEach(file => {
+                playlist.push(createAudioElement(data.session_id, file));
+            });
+            
+            if (!data.files || data.files.length === 0) {
+                audioContainer.innerHTML = '<p>No audio files were generated.</p>';
+            } else if (data.files.length > 1) {
+                // Show download all button if multiple files
+                downloadAllBtn.style.display = 'block';
+            }
+        } else {
+            // Show error message
+            statusMessage.innerHTML = `<p>Error: ${data.error || 'Unknown error occurred'}</p>`;
+            statusMessage.className = 'error';
+        }
+    }
+    
+    // Play an audio element, ignoring autoplay restrictions
+    function playAudio(audio) {
+        const playback = audio.play();
+        if (playback) {
+            playback.catch(() => {});
+        }
+    }
+    
+    // Continue with the next segment when one finishes
+    function playNext(audio) {
+        const index = playlist.indexOf(audio);
+        if (index >= 0 && index + 1 < playlist.length) {
+            playAudio(playlist[index + 1]);
+        } else if (generateBtn.disabled) {
+            // The next segment is still being generated
+            waitingForNext = true;
+        }
+    }
+    
     // Create audio element for a file
     function createAudioElement(sessionId, filename) {
         const audioItem = document.createElement('div');
@@ -197,6 +291,9 @@ document.addEventListener('DOMContentLoaded', function() {
         const audio = document.createElement('audio');
         audio.controls = true;
         audio.src = `/output/${sessionId}/${filename}`;
+        audio.addEventListener('ended', function() {
+            playNext(audio);
+        });
         
         const audioControls = document.createElement('div');
         audioControls.className = 'audio-controls';
@@ -214,6 +311,7 @@ document.addEventListener('DOMContentLoaded', function() {
         audioItem.appendChild(audioControls);
         
         audioContainer.appendChild(audioItem);
+        return audio;
     }
     
     // Download a file
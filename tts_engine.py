@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import audio_cache
+import kokoro_tts
+import metrics
+from batcher import SegmentBatcher
+
+# Maximum number of language pipelines kept resident at once
+MAX_PIPELINES = int(os.environ.get('KOKORO_MAX_PIPELINES', '3'))
+
+# Comma-separated language codes to load at startup, e.g. "a,b"
+PRELOAD_LANGS = [code.strip() for code in os.environ.get('KOKORO_PRELOAD_LANGS', '').split(',') if code.strip()]
+
+# Maximum number of voice tensors kept in memory
+MAX_VOICES = int(os.environ.get('KOKORO_MAX_VOICES', '16'))
+
+# Comma-separated voices to load at startup, e.g. "af_heart,bf_emma"
+PRELOAD_VOICES = [voice.strip() for voice in os.environ.get('KOKORO_PRELOAD_VOICES', '').split(',') if voice.strip()]
+
+# Phrase synthesized with each preloaded voice to verify it, by language code
+VERIFY_TEXT = {'j': 'こんにちは。', 'z': '你好。'}
+DEFAULT_VERIFY_TEXT = 'Hello.'
+
+class PipelinePool:
+    """Registry of KPipeline instances keyed by lang_code with LRU eviction.
+
+    All pipelines share the first loaded KModel, so each extra language only
+    adds its G2P front end. Once more than max_pipelines languages are
+    resident the least recently used one is dropped.
+    """
+
+    def __init__(self, max_pipelines=MAX_PIPELINES):
+        self.max_pipelines = max(1, max_pipelines)
+        self._pipelines = OrderedDict()
+        self._locks = {}
+        self._model = None
+        self._lock = threading.Lock()
+
+    def lock_for(self, lang_code):
+        """Return the lock serializing use of the pipeline for lang_code."""
+        with self._lock:
+            if lang_code not in self._locks:
+                self._locks[lang_code] = threading.Lock()
+            return self._locks[lang_code]
+
+    def get(self, lang_code):
+        """Return the pipeline for lang_code, loading it if needed.
+
+        Returns None when Kokoro is unavailable or the pipeline failed to load.
+        """
+        with self._lock:
+            pipeline = self._pipelines.get(lang_code)
+            if pipeline is not None:
+                self._pipelines.move_to_end(lang_code)
+                return pipeline
+
+        # Load outside the registry lock so other languages stay available
+        with self.lock_for(lang_code):
+            with self._lock:
+                pipeline = self._pipelines.get(lang_code)
+            if pipeline is None:
+                start = time.perf_counter()
+                pipeline = kokoro_tts.create_pipeline(lang_code, model=self._model)
+                metrics.PIPELINE_LOAD_SECONDS.observe(time.perf_counter() - start)
+                if pipeline is None:
+                    return None
+                self._add(lang_code, pipeline)
+            return pipeline
+
+    def _add(self, lang_code, pipeline):
+        with self._lock:
+            if self._model is None:
+                self._model = getattr(pipeline, 'model', None)
+            self._pipelines[lang_code] = pipeline
+            self._pipelines.move_to_end(lang_code)
+            while len(self._pipelines) > self.max_pipelines:
+                evicted, _ = self._pipelines.popitem(last=False)
+                print(f"Evicted pipeline for language code: {evicted}")
+
+    def warm_up(self, lang_codes=None):
+        """Load pipelines for lang_codes (default: KOKORO_PRELOAD_LANGS) ahead of traffic.
+        
+        Returns the language codes whose pipeline could not be loaded.
+        """
+        lang_codes = PRELOAD_LANGS if lang_codes is None else lang_codes
+        failed = []
+        for lang_code in lang_codes[:self.max_pipelines]:
+            print(f"Warming up pipeline for language code: {lang_code}")
+            if self.get(lang_code) is None:
+                failed.append(lang_code)
+        return failed
+
+    def loaded(self):
+        """Return the resident language codes, least recently used first."""
+        with self._lock:
+            return list(self._pipelines)
+
+class VoiceCache:
+    """Bounded LRU cache of loaded voice tensors keyed by voice name.
+
+    Voices are loaded through whichever pipeline asks for them first and then
+    shared with every other pipeline, so each voice file is read from the
+    Hugging Face cache and deserialized once per process.
+    """
+
+    def __init__(self, max_voices=MAX_VOICES):
+        self.max_voices = max(1, max_voices)
+        self.hits = 0
+        self.misses = 0
+        self._voices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pipeline, voice):
+        """Return the voice tensor for voice, loading it with pipeline on a miss.
+
+        Returns None if the voice could not be loaded, in which case the caller
+        should let the pipeline resolve the name itself.
+        """
+        with self._lock:
+            pack = self._voices.get(voice)
+            if pack is not None:
+                self._voices.move_to_end(voice)
+                self.hits += 1
+                return pack
+            self.misses += 1
+
+        try:
+            pack = pipeline.load_voice(voice)
+        except Exception as e:
+            print(f"Error loading voice {voice}: {type(e).__name__}: {e}")
+            return None
+        # The pipeline keeps its own unbounded copy; this cache is the one that is bounded
+        pipeline_voices = getattr(pipeline, 'voices', None)
+        if isinstance(pipeline_voices, dict):
+            pipeline_voices.clear()
+
+        with self._lock:
+            self._voices[voice] = pack
+            self._voices.move_to_end(voice)
+            while len(self._voices) > self.max_voices:
+                self._voices.popitem(last=False)
+        return pack
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._voices)}
+
+class SynthesisEngine:
+    """Long-lived synthesis engine that keeps Kokoro pipelines resident.
+
+    Pipelines are created on first use for each language code and reused by
+    every later request, so the import and model load are paid once per
+    process instead of once per request.
+    """
+
+    def __init__(self, max_pipelines=MAX_PIPELINES, max_voices=MAX_VOICES, results=None):
+        self.pipelines = PipelinePool(max_pipelines)
+        self.voices = VoiceCache(max_voices)
+        self.results = results if results is not None else audio_cache.AudioCache()
+        self.segments = audio_cache.SegmentCache()
+        self.phonemes = audio_cache.PhonemeCache()
+        self.batcher = SegmentBatcher(self._run_batch)
+
+    def warm_up(self, lang_codes=None, voices=None, verify=False):
+        """Load the configured pipelines and voices ahead of traffic.
+        
+        Missing weights and voices are downloaded into the Hugging Face cache
+        here. With verify, every voice also synthesizes a short phrase, which
+        catches broken downloads and pays the model's first-call cost before
+        the first request. Returns a list of problems, empty on success.
+        """
+        errors = [f"Pipeline for language code {lang_code} could not be loaded"
+                  for lang_code in self.pipelines.warm_up(lang_codes)]
+        voices = PRELOAD_VOICES if voices is None else voices
+        for voice in voices:
+            # Voice names start with their language code, e.g. af_heart -> a
+            lang_code = voice[0]
+            pipeline = self.pipelines.get(lang_code)
+            if pipeline is None:
+                errors.append(f"Voice {voice} needs the pipeline for language code {lang_code}")
+                continue
+            print(f"Preloading voice: {voice}")
+            with self.pipelines.lock_for(lang_code):
+                pack = self.voices.get(pipeline, voice)
+                if pack is None:
+                    errors.append(f"Voice {voice} could not be loaded")
+                    continue
+                if not verify:
+                    continue
+                text = VERIFY_TEXT.get(lang_code, DEFAULT_VERIFY_TEXT)
+                try:
+                    segments = list(kokoro_tts.iter_paragraph(pipeline, text, pack, 1.0))
+                except Exception as e:
+                    errors.append(f"Voice {voice} failed to synthesize: {type(e).__name__}: {e}")
+                    continue
+                if not any(kokoro_tts.audio_peak(audio) > 0 for _, _, audio in segments if audio is not None):
+                    errors.append(f"Voice {voice} produced no audio")
+        return errors
+
+    def _run_batch(self, key, payloads):
+        """Run a batch of paragraphs sharing (lang_code, voice, speed).
+
+        Kokoro's KModel only infers one sequence at a time, so the batch is
+        run back to back while holding the pipeline lock once. Paragraphs
+        already phonemized for another voice or speed skip G2P and are
+        synthesized from the phoneme cache.
+        """
+        lang_code, _, speed = key
+        results = []
+        with self.pipelines.lock_for(lang_code):
+            for pipeline, paragraph, voice in payloads:
+                try:
+                    chunks = None
+                    if hasattr(pipeline, 'generate_from_tokens'):
+                        chunks = self.phonemes.get(paragraph, lang_code)
+                    if chunks is not None:
+                        segments = list(kokoro_tts.iter_phonemes(pipeline, chunks, voice, speed))
+                    else:
+                        segments = list(kokoro_tts.iter_paragraph(pipeline, paragraph, voice, speed))
+                        self.phonemes.put(paragraph, lang_code, [(gs, ps) for gs, ps, _ in segments])
+                    results.append(segments)
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    def synthesize(self, text, output_dir, lang_code='a', voice='af_heart', speed=1.0,
+                   on_segment=None, is_cancelled=None, **output_options):
+        """Synthesize text with the resident pipeline for lang_code.
+
+        Identical requests are answered from the audio result cache without
+        touching the model. on_segment is called with (index, filename) as
+        each segment becomes available, and is_cancelled lets the caller stop
+        synthesis between segments. output_options (output_format, stitch,
+        silence_ms, crossfade_ms, chunk_policy) are passed to kokoro_tts.synthesize().
+        The result's timings add 'pipeline_load' (pipeline and voice lookup)
+        and 'total' to the stages measured by kokoro_tts.synthesize().
+        """
+        start = time.perf_counter()
+        key = audio_cache.make_key(text, lang_code, voice, speed, output_options)
+        files = self.results.fetch(key, output_dir)
+        if files is not None:
+            print(f"Audio cache hit: {key}")
+            if on_segment is not None:
+                for i, filename in enumerate(files):
+                    on_segment(i, filename)
+            total = time.perf_counter() - start
+            metrics.GENERATE_SECONDS.observe(total)
+            return {'files': files, 'using_kokoro': True, 'cached': True,
+                    'segments_reused': len(files), 'cancelled': False, 'audio_seconds': None,
+                    'timings': {'pipeline_load': 0.0, 'synthesis': 0.0, 'write': 0.0, 'total': total}}
+
+        load_start = time.perf_counter()
+        pipeline = self.pipelines.get(lang_code)
+        voice_pack = None
+        if pipeline is not None:
+            # KPipeline is not safe to drive from several threads at once
+            with self.pipelines.lock_for(lang_code):
+                voice_pack = self.voices.get(pipeline, voice)
+        pipeline_load = time.perf_counter() - load_start
+        voice_arg = voice_pack if voice_pack is not None else voice
+        batch_key = (lang_code, voice, float(speed))
+
+        def run_paragraph(paragraph):
+            return self.batcher.run(batch_key, (pipeline, paragraph, voice_arg))
+
+        with self.batcher.session(batch_key):
+            result = kokoro_tts.synthesize(text, output_dir, lang_code=lang_code, voice=voice,
+                                           speed=speed, pipeline=pipeline, voice_pack=voice_pack,
+                                           segment_cache=self.segments, on_segment=on_segment,
+                                           is_cancelled=is_cancelled, run_paragraph=run_paragraph,
+                                           phoneme_cache=self.phonemes,
+                                           **output_options)
+
+        # Fallback tones are never cached so they cannot outlive a Kokoro outage
+        if result['using_kokoro'] and not result['cancelled']:
+            self.results.store(key, output_dir, result['files'])
+        result['cached'] = False
+
+        timings = result['timings']
+        timings['pipeline_load'] = pipeline_load
+        timings['total'] = time.perf_counter() - start
+        metrics.SYNTHESIS_SECONDS.observe(timings['synthesis'])
+        metrics.WRITE_SECONDS.observe(timings['write'])
+        metrics.GENERATE_SECONDS.observe(timings['total'])
+        metrics.AUDIO_SECONDS.inc(result['audio_seconds'])
+        return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Download and verify Kokoro weights and voices, e.g. while building an image')
+    parser.add_argument('--langs', type=str, default=','.join(PRELOAD_LANGS),
+                        help='Comma-separated language codes (default: KOKORO_PRELOAD_LANGS)')
+    parser.add_argument('--voices', type=str, default=','.join(PRELOAD_VOICES),
+                        help='Comma-separated voices (default: KOKORO_PRELOAD_VOICES)')
+    args = parser.parse_args(argv)
+    
+    lang_codes = [code.strip() for code in args.langs.split(',') if code.strip()]
+    voices = [voice.strip() for voice in args.voices.split(',') if voice.strip()]
+    # Voices need their language's pipeline even when it was not listed
+    lang_codes += [voice[0] for voice in voices if voice[0] not in lang_codes]
+    engine = SynthesisEngine(max_pipelines=max(MAX_PIPELINES, len(lang_codes)),
+                             max_voices=max(MAX_VOICES, len(voices)),
+                             results=audio_cache.AudioCache(max_mb=0))
+    errors = engine.warm_up(lang_codes, voices, verify=True)
+    for error in errors:
+        print(f"ERROR: {error}")
+    print(f"Preloaded {len(lang_codes)} pipeline(s) and {len(voices)} voice(s)"
+          f"{', with errors' if errors else ''}")
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())